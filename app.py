@@ -1,16 +1,47 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, send_file, Response, has_request_context
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.middleware.proxy_fix import ProxyFix
 import base64
+import gzip
+import io
 import json
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import anthropic
+import asyncio
+import httpx
 import sqlite3
 import hashlib
+import hmac
 import secrets
 import jwt
 import re
+import math
+import heapq
+import bisect
+import cProfile
+import random
+from PIL import Image, ImageOps
+
+try:
+    import brotli
+except ImportError:  # Optional: heritage responses are then offered gzip-only
+    brotli = None
+import queue
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from collections import OrderedDict, defaultdict, deque
+from types import MappingProxyType
+import csv
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import unicodedata
+import click
 
 load_dotenv()
 
@@ -19,16 +50,129 @@ CORS(app, supports_credentials=True)
 
 # ==================== CONFIG ====================
 
+class StubVisionClient:
+    """
+    Offline stand-in for the Anthropic client (VISION_CLIENT=stub), so the
+    detection pipeline can be load-tested without network calls or cost.
+    """
+
+    RESPONSE = '{"detected": true, "siteName": "Petronas Twin Towers", "confidence": 0.95, "description": "Stub detection"}'
+
+    def __init__(self, latency=0.0, response=RESPONSE):
+        self.latency = latency
+        self.response = response
+        self.messages = self
+
+    async def create(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(content=[SimpleNamespace(type='text', text=self.response)])
+
+# Vision calls share one keep-alive connection pool per worker
+VISION_TIMEOUT = float(os.getenv('VISION_TIMEOUT', '60'))
+VISION_MAX_CONNECTIONS = int(os.getenv('VISION_MAX_CONNECTIONS', '64'))
+
 # Initialize Anthropic client for vision API
-client = anthropic.Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
+if os.getenv('VISION_CLIENT', 'anthropic') == 'stub':
+    client = StubVisionClient(latency=float(os.getenv('STUB_VISION_LATENCY', '1.0')))
+else:
+    client = anthropic.AsyncAnthropic(
+        api_key=os.getenv('ANTHROPIC_API_KEY'),
+        timeout=VISION_TIMEOUT,
+        connection_pool_limits=httpx.Limits(
+            max_connections=VISION_MAX_CONNECTIONS,
+            max_keepalive_connections=VISION_MAX_CONNECTIONS
+        )
+    )
 
 # JWT Secret
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key-change-in-production')
 
+# Verified-token cache size (entries), and how often each worker picks up
+# logouts from the others (seconds)
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_REVOCATION_POLL_SECONDS = float(os.getenv('TOKEN_REVOCATION_POLL_SECONDS', '5'))
+
+# Password hashing: scheme for new hashes (pbkdf2_sha256 or scrypt) and its cost.
+# Stored hashes using other parameters are upgraded on the next successful login.
+PASSWORD_SCHEME = os.getenv('PASSWORD_SCHEME', 'pbkdf2_sha256')
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '100000'))
+SCRYPT_PARAMS = (2 ** 14, 8, 1)  # n, r, p
+
+# Hashing runs in a process pool (0 = inline in the request thread)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', str(4 * (os.cpu_count() or 1))))
+
 # Database
-DB_PATH = 'cityconne.db'
+DB_PATH = os.getenv('DB_PATH', 'cityconne.db')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+
+# Issue photos are stored as files keyed by SHA-256, not in the database
+PHOTO_STORE_DIR = os.getenv('PHOTO_STORE_DIR', 'photo_store')
+
+# Resized photo variants generated at upload time: name -> max (width, height)
+PHOTO_VARIANTS = {
+    'thumb': (320, 320),
+    'medium': (1024, 1024),
+}
+PHOTO_CACHE_MAX_AGE = 86400
+
+# Image uploads sent as multipart/form-data or a raw image/* body are
+# streamed in chunks and refused once they pass MAX_UPLOAD_BYTES
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Largest request body read at all, declared or not (chunked uploads have no
+# Content-Length): room for one base64 photo in JSON; bigger requests get 413
+MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(2 * MAX_UPLOAD_BYTES)))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
 
-# In-memory heritage sites (version 2 style)
+# Images are normalized before storage and vision calls: decoded once, turned
+# upright, fitted within a maximum dimension (px), stripped of metadata and
+# re-encoded as IMAGE_FORMAT (jpeg or webp). This runs in a process pool
+# (defaults to the core count; 0 = inline) with a bounded queue.
+PHOTO_MAX_DIMENSION = int(os.getenv('PHOTO_MAX_DIMENSION', '2048'))
+DETECT_MAX_DIMENSION = int(os.getenv('DETECT_MAX_DIMENSION', '1568'))
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '80'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 1)))
+IMAGE_QUEUE = int(os.getenv('IMAGE_QUEUE', str(4 * (os.cpu_count() or 1))))
+
+# Near-duplicate cache for heritage detection results
+DETECT_CACHE_SIZE = int(os.getenv('DETECT_CACHE_SIZE', '10000'))
+DETECT_CACHE_TTL = int(os.getenv('DETECT_CACHE_TTL', str(7 * 24 * 3600)))
+DETECT_CACHE_MAX_DISTANCE = int(os.getenv('DETECT_CACHE_MAX_DISTANCE', '6'))
+
+# Background detection jobs (POST /api/heritage/detect?async=1)
+DETECT_WORKERS = int(os.getenv('DETECT_WORKERS', '4'))
+DETECT_QUEUE_SIZE = int(os.getenv('DETECT_QUEUE_SIZE', '64'))
+DETECT_JOB_TIMEOUT = float(os.getenv('DETECT_JOB_TIMEOUT', '60'))
+
+# Synchronous detections allowed in flight per process; keep this below the
+# server's thread count so slow model calls cannot hold every request thread
+DETECT_MAX_INFLIGHT = int(os.getenv('DETECT_MAX_INFLIGHT', '16'))
+
+# Near-duplicate issue clustering on ingest: an open issue of the same category
+# within this radius and window, with a similar photo, absorbs the new report
+CLUSTER_RADIUS_M = float(os.getenv('CLUSTER_RADIUS_M', '50'))
+CLUSTER_WINDOW_HOURS = float(os.getenv('CLUSTER_WINDOW_HOURS', '72'))
+CLUSTER_MAX_PHOTO_DISTANCE = int(os.getenv('CLUSTER_MAX_PHOTO_DISTANCE', '20'))
+ISSUE_CLOSED_STATUSES = ('resolved', 'rejected', 'closed')
+
+# Issue change feed (GET /api/issues/stream): recent events kept in memory,
+# how often the log is polled, and the idle keep-alive interval (seconds)
+CHANGE_FEED_BUFFER = int(os.getenv('CHANGE_FEED_BUFFER', '1000'))
+CHANGE_FEED_POLL_SECONDS = float(os.getenv('CHANGE_FEED_POLL_SECONDS', '1'))
+CHANGE_FEED_HEARTBEAT_SECONDS = float(os.getenv('CHANGE_FEED_HEARTBEAT_SECONDS', '15'))
+# Open streams per worker (each holds a thread for as long as it is open);
+# keep this plus MAX_CONCURRENT_REQUESTS within WEB_THREADS
+CHANGE_FEED_MAX_SUBSCRIBERS = int(os.getenv('CHANGE_FEED_MAX_SUBSCRIBERS', '8'))
+
+# Issue heatmap: cells are geohashes, with rollups kept for precisions 1..HEATMAP_MAX_PRECISION
+HEATMAP_DEFAULT_PRECISION = 6
+HEATMAP_MAX_PRECISION = 7
+HEATMAP_MAX_CELLS = 10000
+
+# Seed catalogue, written to heritage_sites when the table is empty
 HERITAGE_SITES_IN_MEMORY = [
     {
         'id': 1,
@@ -62,6 +206,75 @@ HERITAGE_SITES_IN_MEMORY = [
     }
 ]
 
+# Alternative names the vision model may return, by site id
+HERITAGE_SITE_ALIASES = {
+    1: ['Bangunan Sultan Abdul Samad'],
+    2: ['Petronas Towers', 'KLCC Twin Towers', 'Menara Berkembar Petronas'],
+    3: ['Batu Caves Temple', 'Gua Batu', 'Sri Subramaniar Swamy Temple'],
+}
+
+# Minimum name similarity (trigram Dice, 0-1) for a detection to count as a
+# catalogue match
+SITE_MATCH_MIN_SCORE = float(os.getenv('SITE_MATCH_MIN_SCORE', '0.7'))
+
+# How often workers check heritage_sites for changes (seconds)
+CATALOGUE_REFRESH_SECONDS = float(os.getenv('CATALOGUE_REFRESH_SECONDS', '30'))
+
+# Per-route and hot-path metrics served at GET /metrics (0 turns the
+# request instrumentation off; hot-path timings are still recorded)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') not in ('0', 'false')
+# Directory where each worker process writes its metrics every
+# METRICS_FLUSH_SECONDS, so /metrics on any worker reports all of them
+# (gunicorn.conf.py sets one up; unset, /metrics covers this process only)
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+
+# Request profiling, off unless configured: requests whose X-Profile header
+# equals PROFILE_TOKEN, and a PROFILE_SAMPLE_RATE fraction of all requests,
+# run under cProfile with the stats written to PROFILE_DIR
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Statements slower than this (ms) are logged with their query plan (0 = off)
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '0'))
+
+# Token-bucket rate limits per user (from the bearer token) or, for anonymous
+# requests, per client IP. Budgets are "<requests>/<seconds>", allowing bursts
+# of up to <requests>; an empty budget is unlimited. Buckets are kept in this
+# process ('memory') or in a SQLite file shared by the workers on a host ('sqlite').
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') not in ('0', 'false')
+RATE_LIMITS = {
+    'auth': os.getenv('RATE_LIMIT_AUTH', '10/60'),
+    'detect': os.getenv('RATE_LIMIT_DETECT', '20/60'),
+    'issue_write': os.getenv('RATE_LIMIT_ISSUE_WRITE', '30/60'),
+    'default': os.getenv('RATE_LIMIT_DEFAULT', '300/60'),
+}
+# Budget drawn from by each endpoint (others use 'default')
+RATE_LIMIT_ROUTES = {
+    'login': 'auth',
+    'signup': 'auth',
+    'detect_heritage': 'detect',
+    'create_issue': 'issue_write',
+    'create_issues_batch': 'issue_write',
+    'update_issue_status': 'issue_write',
+}
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'memory')
+RATE_LIMIT_DB = os.getenv('RATE_LIMIT_DB', 'ratelimit.db')
+# Reverse proxies in front of the app that append to X-Forwarded-For (0 =
+# clients connect directly). The client address is taken that many entries
+# from the right, so anonymous clients get their own rate limit buckets;
+# entries further left are client-supplied and ignored.
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+# Requests handled at once per process before new ones are refused with 503
+# (0 = unlimited). Keep it below WEB_THREADS so spare threads can refuse
+# promptly instead of connections queueing for a thread.
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '24'))
+
+# Endpoints never rate limited or refused for load (monitoring)
+ADMISSION_EXEMPT = {'health_check', 'get_metrics'}
+
 # In-memory issue storage (version 2 style)
 issue_reports_in_memory = []
 next_issue_id_in_memory = 1
@@ -80,6 +293,9 @@ def init_db():
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     
+    # WAL is a property of the database file, so one switch covers every connection
+    c.execute('PRAGMA journal_mode=WAL')
+    
     # Users table
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -91,6 +307,16 @@ def init_db():
         )
     ''')
     
+    # Logged-out tokens (SHA-256 digest), kept until they expire
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER PRIMARY KEY,
+            digest BLOB UNIQUE NOT NULL,
+            exp REAL NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_revoked_tokens_exp ON revoked_tokens(exp)')
+    
     # Heritage sites table
     c.execute('''
         CREATE TABLE IF NOT EXISTS heritage_sites (
@@ -124,297 +350,2963 @@ def init_db():
         )
     ''')
     
+    # Detection results keyed by the image's perceptual hash (hex)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS detection_cache (
+            phash TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    # Full-text index over issue text (external content, synced by triggers)
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'issue_reports_fts'")
+    fts_exists = c.fetchone() is not None
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS issue_reports_fts USING fts5(
+            description, address,
+            content='issue_reports', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    if not fts_exists:
+        c.execute("INSERT INTO issue_reports_fts(issue_reports_fts) VALUES ('rebuild')")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_fts_insert AFTER INSERT ON issue_reports BEGIN
+            INSERT INTO issue_reports_fts (rowid, description, address)
+            VALUES (new.id, new.description, new.address);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_fts_update AFTER UPDATE OF description, address ON issue_reports BEGIN
+            INSERT INTO issue_reports_fts (issue_reports_fts, rowid, description, address)
+            VALUES ('delete', old.id, old.description, old.address);
+            INSERT INTO issue_reports_fts (rowid, description, address)
+            VALUES (new.id, new.description, new.address);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_fts_delete AFTER DELETE ON issue_reports BEGIN
+            INSERT INTO issue_reports_fts (issue_reports_fts, rowid, description, address)
+            VALUES ('delete', old.id, old.description, old.address);
+        END
+    ''')
+    
+    # Append-only change log, written by triggers in the writer's transaction
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS issue_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            issue_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_changes_insert AFTER INSERT ON issue_reports BEGIN
+            INSERT INTO issue_changes (issue_id, event, data)
+            VALUES (new.id, 'created', json_object(
+                'id', new.id, 'category', new.category, 'status', new.status,
+                'latitude', new.latitude, 'longitude', new.longitude, 'createdAt', new.created_at
+            ));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_changes_status AFTER UPDATE OF status ON issue_reports
+        WHEN new.status IS NOT old.status BEGIN
+            INSERT INTO issue_changes (issue_id, event, data)
+            VALUES (new.id, 'status', json_object(
+                'id', new.id, 'status', new.status, 'previousStatus', old.status, 'updatedAt', new.updated_at
+            ));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_changes_update
+        AFTER UPDATE OF category, latitude, longitude, address, description ON issue_reports
+        WHEN new.category IS NOT old.category OR new.latitude IS NOT old.latitude
+            OR new.longitude IS NOT old.longitude OR new.address IS NOT old.address
+            OR new.description IS NOT old.description BEGIN
+            INSERT INTO issue_changes (issue_id, event, data)
+            VALUES (new.id, 'updated', json_object('id', new.id, 'updatedAt', new.updated_at));
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_changes_delete AFTER DELETE ON issue_reports BEGIN
+            INSERT INTO issue_changes (issue_id, event, data)
+            VALUES (old.id, 'deleted', json_object('id', old.id));
+        END
+    ''')
+    # Issues that predate the change log get one 'created' entry, so a delta
+    # sync from version 0 sees every issue. The index is built in the same
+    # step and marks the backfill as done.
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_issue_changes_issue'")
+    if c.fetchone() is None:
+        c.execute('''
+            INSERT INTO issue_changes (issue_id, event, data)
+            SELECT id, 'created', json_object(
+                'id', id, 'category', category, 'status', status,
+                'latitude', latitude, 'longitude', longitude, 'createdAt', created_at
+            )
+            FROM issue_reports WHERE id NOT IN (SELECT issue_id FROM issue_changes)
+            ORDER BY id
+        ''')
+        c.execute('CREATE INDEX idx_issue_changes_issue ON issue_changes(issue_id)')
+    
+    # Heritage catalogue: aliases column and a version bumped on every change
+    aliases_added = add_missing_columns(c, 'heritage_sites', {'aliases': 'TEXT'})
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS catalogue_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute('INSERT OR IGNORE INTO catalogue_version (id, version) VALUES (1, 0)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS heritage_sites_version_{event.lower()} AFTER {event} ON heritage_sites BEGIN
+                UPDATE catalogue_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+    c.execute('SELECT COUNT(*) FROM heritage_sites')
+    if c.fetchone()[0] == 0:
+        c.executemany(f'''
+            INSERT INTO heritage_sites ({HERITAGE_COLUMNS})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [heritage_row(site, HERITAGE_SITE_ALIASES.get(site['id'], [])) for site in HERITAGE_SITES_IN_MEMORY])
+    elif aliases_added:
+        # Seeded before aliases existed: give the seed sites (still under
+        # their seed names) their aliases, and images where none is set
+        c.executemany('''
+            UPDATE heritage_sites SET aliases = ?, image_url = COALESCE(image_url, ?)
+            WHERE id = ? AND name = ?
+        ''', [
+            (json.dumps(HERITAGE_SITE_ALIASES[site['id']]), site.get('imageUrl'), site['id'], site['name'])
+            for site in HERITAGE_SITES_IN_MEMORY if site['id'] in HERITAGE_SITE_ALIASES
+        ])
+    
+    # Detection jobs, shared by every worker process so any of them can answer a poll
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS detection_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            submitted_at REAL NOT NULL,
+            deadline REAL NOT NULL,
+            finished_at REAL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+
+    # Photo columns added when photos moved to the blob store
+    add_missing_columns(c, 'issue_reports', {
+        'photo_sha256': 'TEXT',
+        'photo_size': 'INTEGER',
+    })
+    # Photos still stored inline (older databases) are moved on startup, so
+    # every issue with a photo has photo_sha256 for the feed and /photo
+    c.execute('''
+        CREATE INDEX IF NOT EXISTS idx_issue_reports_legacy_photo
+        ON issue_reports(id) WHERE photo_base64 IS NOT NULL
+    ''')
+    c.execute('SELECT 1 FROM issue_reports WHERE photo_base64 IS NOT NULL LIMIT 1')
+    if c.fetchone():
+        conn.commit()
+        migrate_photos_to_blob_store(conn)
+    
+    # Near-duplicate clusters; a cluster's id is the id of its first (primary) issue
+    add_missing_columns(c, 'issue_reports', {
+        'photo_dhash': 'TEXT',
+        'cluster_id': 'INTEGER',
+    })
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS issue_clusters (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            report_count INTEGER NOT NULL DEFAULT 1,
+            first_reported_at TIMESTAMP,
+            last_reported_at TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_reports_cluster ON issue_reports(cluster_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_clusters_last ON issue_clusters(last_reported_at)')
+    # Most clusters have one report, so counting those with minReports or more reads few entries
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_clusters_reports ON issue_clusters(report_count)')
+    # Issues filed before clustering start out as clusters of one
+    c.execute('''
+        INSERT OR IGNORE INTO issue_clusters (id, category, latitude, longitude, first_reported_at, last_reported_at)
+        SELECT id, category, latitude, longitude, created_at, created_at FROM issue_reports WHERE cluster_id IS NULL
+    ''')
+    c.execute('UPDATE issue_reports SET cluster_id = id WHERE cluster_id IS NULL')
+    
+    # Dashboard rollups, maintained by create/status writes (rebuild with `flask rebuild-rollups`)
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'issue_counts'")
+    rollups_exist = c.fetchone() is not None
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS issue_counts (
+            category TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (category, status)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS issue_geo_counts (
+            precision INTEGER NOT NULL,
+            geohash TEXT NOT NULL,
+            category TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (precision, geohash, category, status)
+        ) WITHOUT ROWID
+    ''')
+    if not rollups_exist:
+        rebuild_issue_rollups(c)
+    
+    # Client-generated id of reports uploaded from an offline queue; makes retries idempotent
+    add_missing_columns(c, 'issue_reports', {'client_id': 'TEXT'})
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_issue_reports_client ON issue_reports(client_id)')
+    
+    # Keyset pagination indexes; the rowid (id) is implicitly the last key
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_reports_created ON issue_reports(created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_reports_status_created ON issue_reports(status, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_issue_reports_category_created ON issue_reports(category, created_at)')
+    
+    # R*Tree spatial index over issue locations, kept in sync by triggers
+    c.execute("SELECT 1 FROM sqlite_master WHERE name = 'issue_reports_rtree'")
+    rtree_exists = c.fetchone() is not None
+    c.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS issue_reports_rtree USING rtree(
+            id, min_lat, max_lat, min_lng, max_lng
+        )
+    ''')
+    if not rtree_exists:
+        c.execute('''
+            INSERT INTO issue_reports_rtree
+            SELECT id, latitude, latitude, longitude, longitude FROM issue_reports
+        ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_rtree_insert AFTER INSERT ON issue_reports BEGIN
+            INSERT INTO issue_reports_rtree
+            VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_rtree_update AFTER UPDATE OF latitude, longitude ON issue_reports BEGIN
+            UPDATE issue_reports_rtree
+            SET min_lat = new.latitude, max_lat = new.latitude, min_lng = new.longitude, max_lng = new.longitude
+            WHERE id = new.id;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS issue_reports_rtree_delete AFTER DELETE ON issue_reports BEGIN
+            DELETE FROM issue_reports_rtree WHERE id = old.id;
+        END
+    ''')
+    
     conn.commit()
     conn.close()
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+def add_missing_columns(cursor, table, columns):
+    """ALTER TABLE for any of columns (name -> type) the table does not have yet; returns the added names"""
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    added = []
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+            added.append(name)
+    return added
 
-def hash_password(password):
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-    return f"{salt}${password_hash.hex()}"
+class Metrics:
+    """
+    Counters, gauges and histograms in the Prometheus text format.
 
-def verify_password(password, password_hash):
+    Each thread records into its own shard of plain dicts, so an observation
+    costs a dict lookup and an add with no lock taken; a scrape sums the
+    shards. Shards of threads that have exited are folded into a retired
+    total when new threads register. Label values are passed as a tuple in
+    the order the metric was declared with.
+
+    With several worker processes, each one dump()s its values to a file in
+    a shared directory and render() adds in the others' files from load(),
+    so any worker can answer a scrape for the whole server.
+    """
+
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+    def __init__(self):
+        self._meta = {}  # name -> (type, help, label names, buckets)
+        self._callbacks = {}  # name -> fn returning {label values: value}
+        self._local = threading.local()
+        self._shards = []  # (thread, shard)
+        self._retired = ({}, {})
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        self._meta[name] = ('counter', help, labels, None)
+
+    def gauge(self, name, help, labels=(), fn=None):
+        """An up-down value set with add(), or read from fn() at scrape time"""
+        self._meta[name] = ('gauge', help, labels, None)
+        if fn is not None:
+            self._callbacks[name] = fn
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help, labels, tuple(buckets))
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = self._local.shard = ({}, {})  # (counters, histograms)
+        with self._lock:
+            live = []
+            for thread, old in self._shards:
+                if thread.is_alive():
+                    live.append((thread, old))
+                else:
+                    self._merge(self._retired, old)
+            live.append((threading.current_thread(), shard))
+            self._shards = live
+        return shard
+
+    @staticmethod
+    def _merge(into, shard):
+        counters, histograms = into
+        for key, value in shard[0].copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, row in shard[1].copy().items():
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(row)
+            else:
+                for i, value in enumerate(list(row)):
+                    total[i] += value
+
+    def add(self, name, labels=(), value=1):
+        counters = self._shard()[0]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self._shard()[1]
+        key = (name, labels)
+        row = histograms.get(key)
+        if row is None:
+            buckets = self._meta[name][3]
+            row = histograms[key] = [0] * (len(buckets) + 2)  # bucket counts, +Inf, sum
+        row[bisect.bisect_left(self._meta[name][3], value)] += 1
+        row[-1] += value
+
+    def snapshot(self):
+        totals = ({}, {})
+        with self._lock:
+            self._merge(totals, self._retired)
+            for _, shard in self._shards:
+                self._merge(totals, shard)
+        return totals
+
+    def values(self):
+        """(counters, histograms) summed over threads, with callback gauges read now"""
+        counters, histograms = self.snapshot()
+        for name, fn in self._callbacks.items():
+            try:
+                for labels, value in fn().items():
+                    counters[(name, labels)] = value
+            except Exception:
+                pass
+        return counters, histograms
+
+    def dump(self, path, gauges=True):
+        """
+        Write this process's values to path (atomically). A process that is
+        exiting leaves its gauges out, since they describe live state.
+        """
+        counters, histograms = self.values()
+        data = {
+            'pid': os.getpid(),
+            'counters': [
+                [name, list(labels), value] for (name, labels), value in counters.items()
+                if gauges or self._meta[name][0] != 'gauge'
+            ],
+            'histograms': [[name, list(labels), row] for (name, labels), row in histograms.items()],
+        }
+        partial = f'{path}.tmp'
+        with open(partial, 'w') as f:
+            json.dump(data, f)
+        os.replace(partial, path)
+
+    def load(self, directory, exclude=None):
+        """
+        Values dumped by other processes into directory, skipping the file
+        exclude. Gauges of processes that are no longer running are dropped;
+        their counters and histograms still count.
+        """
+        totals = ({}, {})
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.json') or entry.path == exclude:
+                continue
+            try:
+                with open(entry.path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            running = process_running(data['pid'])
+            counters = {
+                (name, tuple(labels)): value for name, labels, value in data['counters']
+                if name in self._meta and (running or self._meta[name][0] != 'gauge')
+            }
+            histograms = {
+                (name, tuple(labels)): row for name, labels, row in data['histograms']
+                if name in self._meta and len(row) == len(self._meta[name][3]) + 2
+            }
+            self._merge(totals, (counters, histograms))
+        return totals
+
+    def render(self, others=()):
+        """Prometheus text for this process's values plus any (counters, histograms) in others"""
+        totals = self.values()
+        for other in others:
+            self._merge(totals, other)
+        counters, histograms = totals
+        series = defaultdict(list)
+        for (name, labels), value in counters.items():
+            series[name].append((labels, value))
+        for (name, labels), row in histograms.items():
+            series[name].append((labels, row))
+
+        lines = []
+        for name, (kind, text, label_names, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series.get(name, ()), key=lambda item: item[0]):
+                pairs = [f'{k}="{metric_label(v)}"' for k, v in zip(label_names, labels)]
+                if kind != 'histogram':
+                    lines.append(f'{name}{metric_labels(pairs)} {value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), value):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{metric_labels(pairs + [le])} {cumulative}')
+                lines.append(f'{name}_sum{metric_labels(pairs)} {value[-1]}')
+                lines.append(f'{name}_count{metric_labels(pairs)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+def process_running(pid):
     try:
-        salt, hash_val = password_hash.split('$')
-        password_check = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
-        return password_check.hex() == hash_val
-    except:
+        os.kill(pid, 0)
+    except ProcessLookupError:
         return False
+    except PermissionError:
+        pass
+    return True
 
-def create_token(user_id, email, username):
-    payload = {
-        'user_id': user_id,
-        'email': email,
-        'username': username,
-        'exp': datetime.utcnow() + timedelta(days=30)
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+def metric_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
-def verify_token(token):
-    try:
-        return jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-    except:
-        return None
+def metric_labels(pairs):
+    return '{' + ','.join(pairs) + '}' if pairs else ''
 
-def get_current_user():
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        return None
-    try:
-        token = auth_header.split(' ')[1]
-        return verify_token(token)
-    except:
-        return None
+metrics = Metrics()
+metrics.counter('cityconnect_http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+metrics.counter('cityconnect_http_request_errors_total', 'HTTP requests answered with a 5xx or an unhandled exception', ('method', 'route'))
+metrics.histogram('cityconnect_http_request_duration_seconds', 'Time to produce the response (streamed bodies excluded)', ('method', 'route'))
+metrics.gauge('cityconnect_http_requests_in_flight', 'Requests being handled (streamed bodies excluded)')
+metrics.histogram('cityconnect_http_request_size_bytes', 'Request body size', ('route',), Metrics.SIZE_BUCKETS)
+metrics.histogram('cityconnect_http_response_size_bytes', 'Response body size, when known up front', ('route',), Metrics.SIZE_BUCKETS)
+metrics.histogram('cityconnect_db_statement_duration_seconds', 'SQLite execute() time by statement kind and table', ('statement',))
+metrics.histogram('cityconnect_password_hash_duration_seconds', 'Password key derivation time, including the wait for a hashing worker', ('scheme',))
+metrics.histogram('cityconnect_jwt_verify_duration_seconds', 'Bearer token verification time', ('cache',))
+metrics.histogram('cityconnect_vision_request_duration_seconds', 'Vision model round-trip time', ('outcome',))
+metrics.counter('cityconnect_rate_limited_total', 'Requests refused with 429, by budget', ('budget',))
+metrics.counter('cityconnect_requests_shed_total', 'Requests refused with 503 because MAX_CONCURRENT_REQUESTS were in progress')
+metrics.histogram('cityconnect_vision_request_size_bytes', 'Base64 image size sent to the vision model', (), Metrics.SIZE_BUCKETS)
 
-# ==================== INITIALIZATION ====================
+class MetricsMiddleware:
+    """
+    WSGI wrapper recording request counts, latency, sizes and in-flight
+    requests. It reads the environ and start_response arguments directly,
+    which is far cheaper than Flask's request proxies; a before_request hook
+    stores the matched route under 'cityconnect.route'. Latency runs to the
+    response headers, so streamed bodies are not included.
+    """
 
-init_db()
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
 
-# ==================== AUTHENTICATION ENDPOINTS ====================
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        response = [500, None]  # status, content length
 
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    """Login user"""
-    try:
-        data = request.get_json()
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not email or not password:
-            return jsonify({'success': False, 'message': 'Email and password required'}), 400
-        
-        conn = get_db()
-        c = conn.cursor()
-        c.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = c.fetchone()
-        conn.close()
-        
-        if not user or not verify_password(password, user['password_hash']):
-            return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
-        
-        token = create_token(user['id'], user['email'], user['username'])
-        return jsonify({
-            'success': True,
-            'token': token,
-            'userId': user['id'],
-            'username': user['username'],
-            'email': user['email']
-        }), 200
-    
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        def start(status, headers, exc_info=None):
+            response[0] = int(status[:3])
+            for name, value in headers:
+                if name == 'Content-Length':
+                    response[1] = int(value)
+            return start_response(status, headers, exc_info)
 
-@app.route('/api/auth/signup', methods=['POST'])
-def signup():
-    """Sign up new user"""
-    try:
-        data = request.get_json()
-        email = data.get('email')
-        password = data.get('password')
-        
-        if not email or not password:
-            return jsonify({'success': False, 'message': 'Email and password required'}), 400
-        
-        password_hash = hash_password(password)
-        
-        conn = get_db()
-        c = conn.cursor()
-        
+        metrics.add('cityconnect_http_requests_in_flight')
         try:
-            c.execute('''
-                INSERT INTO users (email, password_hash, username)
-                VALUES (?, ?, ?)
-            ''', (email, password_hash, email.split('@')[0]))
-            conn.commit()
-            
-            user_id = c.lastrowid
-            token = create_token(user_id, email, email.split('@')[0])
-            
-            return jsonify({
-                'success': True,
-                'token': token,
-                'userId': user_id,
-                'username': email.split('@')[0],
-                'email': email
-            }), 201
-        
-        except sqlite3.IntegrityError:
-            return jsonify({'success': False, 'message': 'Email already exists'}), 409
-        
+            return self.wsgi_app(environ, start)
         finally:
-            conn.close()
-    
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
-
-# ==================== HERITAGE ENDPOINTS ====================
+            elapsed = time.perf_counter() - started
+            metrics.add('cityconnect_http_requests_in_flight', (), -1)
+            method = environ['REQUEST_METHOD']
+            route = environ.get('cityconnect.route', 'unmatched')
+            status, length = response
+            metrics.observe('cityconnect_http_request_duration_seconds', elapsed, (method, route))
+            metrics.add('cityconnect_http_requests_total', (method, route, status))
+            if status >= 500:
+                metrics.add('cityconnect_http_request_errors_total', (method, route))
+            if environ.get('CONTENT_LENGTH'):
+                metrics.observe('cityconnect_http_request_size_bytes', int(environ['CONTENT_LENGTH']), (route,))
+            if length is not None:
+                metrics.observe('cityconnect_http_response_size_bytes', length, (route,))
 
-@app.route('/api/heritage/detect', methods=['POST'])
-def detect_heritage():
+class RequestProfiler:
     """
-    Hybrid: Use in-memory sites for matching, Claude for detection
+    WSGI wrapper that runs chosen requests under cProfile and writes the
+    stats to profile_dir as <time>.<method>.<route>.<ms>ms.prof, for
+    python -m pstats or snakeviz. A request is chosen when its X-Profile
+    header matches token, or at random with probability sample_rate. Only
+    the time to the response headers is profiled, so event streams are
+    safe to sample. Not installed at all unless profiling is configured.
     """
-    try:
-        data = request.get_json()
-        image_base64 = data.get('imageBase64')
 
-        if not image_base64:
-            return jsonify({'error': 'Image data required'}), 400
+    def __init__(self, wsgi_app, profile_dir, sample_rate=0.0, token=''):
+        self.wsgi_app = wsgi_app
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.token = token
+        os.makedirs(profile_dir, exist_ok=True)
 
-        # Call Claude Vision API
-        message = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=1024,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": data.get("mimeType", "image/jpeg"),
-                                "data": image_base64,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": """Analyze this image and respond ONLY in JSON:
-                            {
-                                "detected": true/false,
-                                "siteName": "name",
-                                "confidence": 0.95,
-                                "description": "text"
-                            }"""
-                        }
-                    ],
-                }
-            ],
-        )
+    def wanted(self, environ):
+        header = environ.get('HTTP_X_PROFILE')
+        if header and self.token and hmac.compare_digest(header, self.token):
+            return True
+        return random.random() < self.sample_rate
 
-        response_text = ""
-        for block in message.content:
-            if block.type == "text":
-                response_text += block.text
+    def __call__(self, environ, start_response):
+        if not self.wanted(environ):
+            return self.wsgi_app(environ, start_response)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            return profiler.runcall(self.wsgi_app, environ, start_response)
+        finally:
+            self.dump(profiler, environ, time.perf_counter() - started)
 
-        json_text = extract_json(response_text)
-        detection_result = json.loads(json_text)
+    def dump(self, profiler, environ, elapsed):
+        route = environ.get('cityconnect.route') or environ.get('PATH_INFO', '')
+        name = re.sub(r'[^A-Za-z0-9_]+', '.', route).strip('.') or 'root'
+        filename = '{}.{}.{}.{:.0f}ms.{}.prof'.format(
+            time.strftime('%Y%m%dT%H%M%S'), environ['REQUEST_METHOD'], name, elapsed * 1000, uuid.uuid4().hex[:6]
+        )
+        path = os.path.join(self.profile_dir, filename)
+        profiler.dump_stats(path)
+        app.logger.info('Profiled %s %s in %.1f ms: %s', environ['REQUEST_METHOD'], route, elapsed * 1000, path)
 
-        if detection_result.get('detected'):
-            site_name = detection_result.get('siteName', '')
-            matching_site = next(
-                (s for s in HERITAGE_SITES_IN_MEMORY if s['name'].lower() in site_name.lower() or site_name.lower() in s['name'].lower()),
-                None
-            )
-            if matching_site:
-                return jsonify({'detected': True, 'site': matching_site}), 200
-            else:
-                return jsonify({'detected': True, 'site': {
-                    'id': 999,
-                    'name': detection_result.get('siteName', 'Heritage Site'),
-                    'description': detection_result.get('description', 'A historic landmark'),
-                    'historicalPeriod': 'Historic',
-                    'isWheelchairAccessible': False,
-                    'latitude': 3.1413,
-                    'longitude': 101.6964
-                }}), 200
-        else:
-            return jsonify({'detected': False, 'message': 'No heritage site detected'}), 200
+SQL_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(\w+)', re.IGNORECASE)
+_sql_statement_labels = {}
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+def sql_statement_label(sql):
+    """Low-cardinality label for a statement: its verb and first table"""
+    label = _sql_statement_labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].upper() if words else ''
+        table = SQL_STATEMENT_TABLE.search(sql) if verb not in ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA') else None
+        label = f'{verb} {table.group(1)}' if table else verb
+        if len(_sql_statement_labels) < 4096:
+            _sql_statement_labels[sql] = label
+    return label
 
-@app.route('/api/heritage/list', methods=['GET'])
-def get_heritage_list():
-    wheelchair_only = request.args.get('wheelchairOnly', 'false').lower() == 'true'
-    if wheelchair_only:
-        sites = [s for s in HERITAGE_SITES_IN_MEMORY if s['isWheelchairAccessible']]
-    else:
-        sites = HERITAGE_SITES_IN_MEMORY
-    return jsonify({'sites': sites, 'total': len(sites)}), 200
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute() calls into the statement histogram"""
 
-@app.route('/api/heritage/<int:site_id>', methods=['GET'])
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe('cityconnect_db_statement_duration_seconds', time.perf_counter() - started, (sql_statement_label(sql),))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe('cityconnect_db_statement_duration_seconds', time.perf_counter() - started, (sql_statement_label(sql),))
+
+SQL_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+def log_slow_query(conn, sql, parameters, elapsed):
+    """Log a slow statement with its EXPLAIN QUERY PLAN (parameters are not logged)"""
+    plan = '-'
+    if sql.lstrip()[:7].upper().startswith(SQL_EXPLAINABLE):
+        try:
+            # The base class execute, so explaining is neither timed nor logged
+            rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            plan = '; '.join(row[3] for row in rows)
+        except sqlite3.Error as e:
+            plan = f'unavailable ({e})'
+    where = f'{request.method} {request.path}' if has_request_context() else 'background'
+    app.logger.warning('Slow query (%.1f ms, %s): %s | plan: %s', elapsed * 1000, where, ' '.join(sql.split()), plan)
+
+class SlowQueryCursor(InstrumentedCursor):
+    """
+    Cursor that also logs statements slower than SLOW_QUERY_MS. A SELECT
+    does most of its work as rows are stepped, so the time spent in
+    execute() and in every fetch (fetchone, fetchmany, fetchall and
+    iteration) is added up, and the statement is logged once, as soon as
+    that total passes the threshold.
+    """
+
+    _pending = None  # [sql, parameters, seconds so far] until logged
+
+    def execute(self, sql, parameters=()):
+        self._pending = None
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self._pending = [sql, parameters, 0.0]
+        self._spent(started)
+        return cursor
+
+    def _spent(self, started):
+        pending = self._pending
+        if pending is None:
+            return
+        pending[2] += time.perf_counter() - started
+        if pending[2] * 1000 >= SLOW_QUERY_MS:
+            self._pending = None
+            log_slow_query(self.connection, *pending)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._spent(started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._spent(started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._spent(started)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return super().__next__()
+        finally:
+            self._spent(started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, and execute() shortcuts, are timed"""
+
+    cursor_class = InstrumentedCursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class SlowQueryConnection(InstrumentedConnection):
+    """Connection used instead when SLOW_QUERY_MS is set"""
+
+    cursor_class = SlowQueryCursor
+
+class ConnectionPool:
+    """
+    Thread-safe pool of SQLite connections.
+
+    Connections are opened once and each keeps its prepared-statement
+    cache warm between requests. init_db has already switched the database
+    to WAL mode, so readers are not blocked by a writer. A size of 0 opens
+    a fresh connection per request instead.
+    """
+
+    # busy_timeout first, so the pragmas after it wait out other connections
+    PRAGMAS = (
+        'PRAGMA busy_timeout=5000',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA mmap_size=268435456',
+        'PRAGMA temp_store=MEMORY',
+    )
+
+    def __init__(self, path, size, statement_cache_size=256):
+        self.path = path
+        self.size = size
+        self.statement_cache_size = statement_cache_size
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size) if size else None
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            factory=SlowQueryConnection if SLOW_QUERY_MS else InstrumentedConnection
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self, timeout=30):
+        if not self.size:
+            return self.connect()
+        if not self._slots.acquire(timeout=timeout):
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self.connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        if not self.size:
+            conn.close()
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+db_pool = ConnectionPool(DB_PATH, DB_POOL_SIZE)
+
+def get_db():
+    """Return the pooled connection bound to the current app context"""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
+
+class BlobStore:
+    """
+    Content-addressed file store. Each blob is written once under its
+    SHA-256 hex digest, fanned out by the first two characters.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def variant_path(self, digest, name):
+        return f"{self.path_for(digest)}.{name}.jpg"
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put(self, data):
+        """Store bytes and return (sha256 hex digest, size)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            self.write(path, data)
+        return digest, len(data)
+
+    def write(self, path, data):
+        """Write via a temp file so readers never see a partial blob"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def open(self, digest):
+        return open(self.path_for(digest), 'rb')
+
+    def read(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+blob_store = BlobStore(PHOTO_STORE_DIR)
+
+def decode_photo(photo_base64):
+    """Decode a (possibly data-URL prefixed) base64 photo into bytes"""
+    if ',' in photo_base64[:100]:
+        photo_base64 = photo_base64.split(',', 1)[1]
+    photo_base64 = re.sub(r'\s+', '', photo_base64)
+    photo_base64 += '=' * (-len(photo_base64) % 4)
+    try:
+        return base64.b64decode(photo_base64, validate=True)
+    except ValueError:
+        raise ValueError('Invalid photo data')
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+def sniff_image_type(header):
+    """Mime type from an image's leading bytes, or None if unrecognised"""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+class UploadTooLarge(Exception):
+    """An image upload is bigger than MAX_UPLOAD_BYTES"""
+
+def image_upload(field):
+    """
+    (stream, fields) for an image sent as the multipart/form-data file
+    `field` (other form fields alongside) or as a raw image/* body (fields
+    in the query string); None for JSON requests. A declared body size over
+    the limit is refused before anything is read.
+    """
+    if request.mimetype.startswith('image/'):
+        limit = MAX_UPLOAD_BYTES
+    elif request.mimetype == 'multipart/form-data':
+        limit = MAX_UPLOAD_BYTES + UPLOAD_CHUNK_SIZE  # room for the other form fields
+    else:
+        return None
+    if request.content_length is not None and request.content_length > limit:
+        raise UploadTooLarge()
+    if request.mimetype.startswith('image/'):
+        return request.stream, request.args
+    upload = request.files.get(field)
+    if upload is None:
+        raise ValueError(f'{field} file is required')
+    return upload.stream, request.form
+
+def read_image_upload(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Yield an uploaded image in UPLOAD_CHUNK_SIZE chunks, the first being its
+    header. Stops with ValueError as soon as the header is not a known image
+    type, or UploadTooLarge once the size passes max_bytes.
+    """
+    header = b''
+    while len(header) < 12:
+        chunk = stream.read(12 - len(header))
+        if not chunk:
+            break
+        header += chunk
+    if sniff_image_type(header) is None:
+        raise ValueError('Unsupported image type')
+    size = len(header)
+    yield header
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge()
+        yield chunk
+
+def save_image_upload(stream, f):
+    """Copy an uploaded image into an open file, chunk by chunk"""
+    for chunk in read_image_upload(stream):
+        f.write(chunk)
+    f.flush()
+
+def server_busy_response(message='Server busy, please try again shortly'):
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def upload_too_large_response():
+    return jsonify({'error': f'Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large_response(e=None):
+    return jsonify({'error': f'Request body is larger than {MAX_REQUEST_BYTES // (1024 * 1024)} MB'}), 413
+
+def request_json():
+    """
+    request.get_json(), raising RequestEntityTooLarge for a chunked body that
+    reached MAX_REQUEST_BYTES (Werkzeug cuts it off there without raising)
+    """
+    if len(request.get_data(cache=True)) >= MAX_REQUEST_BYTES:
+        raise RequestEntityTooLarge()
+    return request.get_json()
+
+def normalize_image(source, max_dimension, variants=None):
+    """
+    Decode an image (bytes or a file path) once. Return it upright, fitted
+    within max_dimension and re-encoded as IMAGE_FORMAT without EXIF or
+    other metadata, with JPEG bytes for each of variants (name -> max size)
+    and its dHash. Runs in the image worker processes.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        # Downscale before rotating; thumbnail() lets JPEGs decode at a reduced scale
+        img.thumbnail((max_dimension, max_dimension), Image.BICUBIC)
+        img = ImageOps.exif_transpose(img).convert('RGB')
+    
+    buf = io.BytesIO()
+    if IMAGE_FORMAT == 'webp':
+        img.save(buf, 'WEBP', quality=IMAGE_QUALITY, method=4)
+        mime_type = 'image/webp'
+    else:
+        img.save(buf, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+        mime_type = 'image/jpeg'
+    
+    resized = {}
+    for name, size in (variants or {}).items():
+        variant = img.copy()
+        variant.thumbnail(size)
+        variant_buf = io.BytesIO()
+        variant.save(variant_buf, 'JPEG', quality=80, optimize=True)
+        resized[name] = variant_buf.getvalue()
+    
+    return {'data': buf.getvalue(), 'mimeType': mime_type, 'variants': resized, 'dhash': pixels_dhash(img)}
+
+def make_photo_variants(digest, data=None):
+    """Write the resized JPEG variants of a stored photo that are not on disk yet"""
+    missing = [name for name in PHOTO_VARIANTS if not os.path.exists(blob_store.variant_path(digest, name))]
+    if not missing:
+        return
+    # Without the bytes, let Pillow read the stored blob from disk
+    source = io.BytesIO(data) if data is not None else blob_store.path_for(digest)
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        for name in missing:
+            variant = img.copy()
+            variant.thumbnail(PHOTO_VARIANTS[name])
+            buf = io.BytesIO()
+            variant.save(buf, 'JPEG', quality=80, optimize=True)
+            blob_store.write(blob_store.variant_path(digest, name), buf.getvalue())
+
+def migrate_photos_to_blob_store(conn, batch_size=200):
+    """Move inline photo_base64 values into the blob store. Returns rows moved."""
+    c = conn.cursor()
+    moved = 0
+    last_id = 0
+    while True:
+        c.execute('''
+            SELECT id, photo_base64 FROM issue_reports
+            WHERE photo_base64 IS NOT NULL AND id > ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size))
+        rows = c.fetchall()
+        if not rows:
+            return moved
+        for row in rows:
+            last_id = row[0]
+            try:
+                digest, size = blob_store.put(decode_photo(row[1]))
+            except ValueError:
+                continue
+            c.execute('''
+                UPDATE issue_reports
+                SET photo_sha256 = ?, photo_size = ?, photo_base64 = NULL
+                WHERE id = ?
+            ''', (digest, size, row[0]))
+            moved += 1
+        conn.commit()
+
+class VisionLoop:
+    """
+    Background asyncio event loop for the vision model client, so every
+    detection in the worker shares one keep-alive connection pool. The
+    caller still blocks in run() for the whole call: each detection holds
+    a request thread (at most DETECT_MAX_INFLIGHT) or a job worker thread
+    (DETECT_WORKERS) until the model answers.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='vision-loop', daemon=True).start()
+
+    def run(self, coro, timeout):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self, vision_client):
+        if hasattr(vision_client, 'close'):
+            self.run(vision_client.close(), timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def image_dhash(data):
+    """
+    64-bit difference hash of an image (bytes or a file path): robust to
+    rescaling and recompression
+    """
+    with Image.open(io.BytesIO(data) if isinstance(data, bytes) else data) as img:
+        img.draft('L', (64, 64))
+        return pixels_dhash(img)
+
+def pixels_dhash(img):
+    """dHash of an already opened image"""
+    pixels = img.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """BK-tree of integer hashes for Hamming-distance range queries"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value):
+        if self.root is None:
+            self.root = (value, {})
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (value, {})
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """All (distance, value) pairs within max_distance of value"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                found.append((distance, node_value))
+            for d in range(max(1, distance - max_distance), distance + max_distance + 1):
+                child = children.get(d)
+                if child:
+                    stack.append(child)
+        return found
+
+class DetectionCache:
+    """
+    Cache of vision-model detection results keyed by the image's dHash.
+
+    A lookup returns the result of the closest cached hash within
+    max_distance bits, so near-duplicate photos of the same landmark skip the
+    model call. Entries expire after ttl seconds, the least recently used
+    are evicted past max_entries, and everything is mirrored to the
+    detection_cache table so the cache survives restarts.
+    """
+
+    def __init__(self, max_entries, ttl, max_distance):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # phash -> (expires_at, result)
+        self._tree = BKTree()
+        self._removed = 0
+        self._lock = threading.Lock()
+
+    def load(self, conn):
+        now = time.time()
+        conn.execute('DELETE FROM detection_cache WHERE expires_at <= ?', (now,))
+        conn.commit()
+        rows = conn.execute('SELECT phash, result, expires_at FROM detection_cache ORDER BY expires_at').fetchall()
+        with self._lock:
+            for phash_hex, result, expires_at in rows[-self.max_entries:]:
+                phash = int(phash_hex, 16)
+                self._entries[phash] = (expires_at, json.loads(result))
+                self._tree.add(phash)
+
+    def lookup(self, phash):
+        now = time.time()
+        with self._lock:
+            for _, candidate in sorted(self._tree.search(phash, self.max_distance)):
+                entry = self._entries.get(candidate)
+                if entry and entry[0] > now:
+                    self._entries.move_to_end(candidate)
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+            return None
+
+    def store(self, phash, result, conn):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._entries[phash] = (expires_at, result)
+            self._entries.move_to_end(phash)
+            self._tree.add(phash)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            # Evicted hashes stay in the tree until it is rebuilt
+            self._removed += len(evicted)
+            if self._removed > self.max_entries:
+                self._tree = BKTree()
+                for key in self._entries:
+                    self._tree.add(key)
+                self._removed = 0
+        conn.execute(
+            'INSERT OR REPLACE INTO detection_cache (phash, result, expires_at) VALUES (?, ?, ?)',
+            (f'{phash:016x}', json.dumps(result), expires_at)
+        )
+        conn.executemany('DELETE FROM detection_cache WHERE phash = ?', [(f'{h:016x}',) for h in evicted])
+        conn.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'maxDistance': self.max_distance,
+            }
+
+class JobQueue:
+    """
+    Bounded queue drained by a fixed pool of worker threads.
+
+    submit() raises queue.Full when max_pending jobs are already waiting,
+    so callers can push back instead of piling up work. Job status and
+    results are kept in the detection_jobs table, so a poll can be
+    answered by any worker process, not just the one running the job. A
+    job that is not finished within timeout seconds of submission is
+    reported as timed out and its eventual result is discarded. Finished
+    jobs are kept for result_ttl seconds for polling.
+    """
+
+    def __init__(self, workers, max_pending, timeout, connect, result_ttl=600):
+        self.workers = workers
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._connect = connect
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, conn, fn, *args):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            if not self._threads:
+                self._start()
+        conn.execute('DELETE FROM detection_jobs WHERE deadline < ?', (now - self.result_ttl,))
+        conn.execute(
+            "INSERT INTO detection_jobs (id, status, submitted_at, deadline) VALUES (?, 'queued', ?, ?)",
+            (job_id, now, now + self.timeout)
+        )
+        conn.commit()
+        try:
+            self._queue.put_nowait((job_id, fn, args))
+        except queue.Full:
+            conn.execute('DELETE FROM detection_jobs WHERE id = ?', (job_id,))
+            conn.commit()
+            raise
+        return job_id
+
+    def get(self, conn, job_id):
+        row = conn.execute(
+            'SELECT id, status, deadline, result, error FROM detection_jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = {'id': row['id'], 'status': row['status']}
+        if job['status'] in ('queued', 'running') and time.time() > row['deadline']:
+            self._finish(conn, job_id, 'timeout', error='Job timed out')
+            job.update(status='timeout', error='Job timed out')
+            return job
+        if row['result'] is not None:
+            job['result'] = json.loads(row['result'])
+        if row['error'] is not None:
+            job['error'] = row['error']
+        return job
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _work(self):
+        conn = self._connect()
+        while True:
+            job_id, fn, args = self._queue.get()
+            try:
+                claimed = conn.execute('''
+                    UPDATE detection_jobs SET status = 'running'
+                    WHERE id = ? AND status = 'queued' AND deadline >= ?
+                    RETURNING deadline
+                ''', (job_id, time.time())).fetchone()
+                conn.commit()
+                if claimed is None:
+                    self._finish(conn, job_id, 'timeout', error='Job timed out')
+                    continue
+                try:
+                    result, error = fn(*args), None
+                except Exception as e:
+                    result, error = None, str(e)
+                if time.time() > claimed['deadline']:
+                    self._finish(conn, job_id, 'timeout', error='Job timed out')
+                elif error is not None:
+                    self._finish(conn, job_id, 'failed', error=error)
+                else:
+                    self._finish(conn, job_id, 'done', result=result)
+            except sqlite3.Error as e:
+                app.logger.warning('Detection job %s could not be recorded: %s', job_id, e)
+
+    def _finish(self, conn, job_id, status, result=None, error=None):
+        """Record a job's outcome unless it already has one"""
+        conn.execute('''
+            UPDATE detection_jobs SET status = ?, finished_at = ?, result = ?, error = ?
+            WHERE id = ? AND status IN ('queued', 'running')
+        ''', (status, time.time(), None if result is None else json.dumps(result), error, job_id))
+        conn.commit()
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller runs the
+    function and every caller waiting on the same key gets its result, or
+    its exception.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = SimpleNamespace(done=threading.Event(), result=None, error=None)
+                self._in_flight[key] = call
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'upstreamCalls': self.calls,
+                'coalesced': self.coalesced,
+                'inFlight': len(self._in_flight),
+            }
+
+NAME_ABBREVIATIONS = {
+    'abd': 'abdul',
+    'bldg': 'building',
+    'jln': 'jalan',
+    'kg': 'kampung',
+    'masjid': 'mosque',
+    'mt': 'mount',
+    'st': 'saint',
+}
+
+def normalize_name(name):
+    """Lowercase, strip accents and punctuation, expand common abbreviations"""
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    tokens = re.findall(r'[a-z0-9]+', name)
+    return ' '.join(NAME_ABBREVIATIONS.get(t, t) for t in tokens)
+
+def name_trigrams(normalized):
+    """Character trigrams of each word, padded so word starts weigh more"""
+    grams = set()
+    for token in normalized.split():
+        padded = f'  {token} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class SiteNameIndex:
+    """
+    Trigram index over heritage site names and aliases.
+
+    match() only scores names sharing one of the query's rarer trigrams,
+    so lookups stay fast on large catalogues. The score is the Dice
+    coefficient of the two trigram sets, which stays low when a detection
+    only shares one generic word ("Towers", "Building") with a name.
+    """
+
+    def __init__(self, sites, aliases=None):
+        self.sites = list(sites)
+        self._names = []  # (site position, trigram set)
+        self._postings = defaultdict(list)
+        aliases = aliases or {}
+        for position, site in enumerate(self.sites):
+            for name in [site['name']] + aliases.get(site['id'], []):
+                grams = frozenset(name_trigrams(normalize_name(name)))
+                if not grams:
+                    continue
+                name_id = len(self._names)
+                self._names.append((position, grams))
+                for gram in grams:
+                    self._postings[gram].append(name_id)
+        # Postings longer than this only widen the candidate set once rarer ones have been used
+        self.common_posting_size = max(64, len(self._names) // 100)
+
+    def match(self, query, min_score=0.0):
+        """Best (site, score) for a name, or (None, score) below min_score"""
+        grams = name_trigrams(normalize_name(query or ''))
+        if not grams:
+            return None, 0.0
+        candidates = set()
+        for postings in sorted((self._postings.get(g, ()) for g in grams), key=len):
+            if candidates and len(postings) > self.common_posting_size:
+                break
+            candidates.update(postings)
+        best_site, best_score = None, 0.0
+        for name_id in candidates:
+            position, name_grams = self._names[name_id]
+            score = 2 * len(grams & name_grams) / (len(grams) + len(name_grams))
+            if score > best_score:
+                best_site, best_score = self.sites[position], score
+        if best_score < min_score:
+            return None, best_score
+        return best_site, best_score
+
+HERITAGE_COLUMNS = '''id, name, description, historical_period, latitude, longitude,
+    is_wheelchair_accessible, image_url, aliases'''
+
+def heritage_row(site, aliases):
+    """Column values for an API-shaped site dict, in HERITAGE_COLUMNS order"""
+    return (
+        site.get('id'),
+        site['name'],
+        site.get('description'),
+        site.get('historicalPeriod'),
+        site.get('latitude'),
+        site.get('longitude'),
+        1 if site.get('isWheelchairAccessible') else 0,
+        site.get('imageUrl'),
+        json.dumps(aliases) if aliases else None,
+    )
+
+class PreparedResponse:
+    """
+    A JSON body serialized once, with gzip (and brotli, when installed)
+    copies and a strong ETag, so repeat requests cost no serialization.
+    """
+
+    MIN_COMPRESS_SIZE = 512
+
+    def __init__(self, payload):
+        self.body = app.json.dumps(payload).encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.encoded = {}
+        if len(self.body) >= self.MIN_COMPRESS_SIZE:
+            if brotli is not None:
+                self.encoded['br'] = brotli.compress(self.body)
+            self.encoded['gzip'] = gzip.compress(self.body, compresslevel=9)
+
+    def respond(self):
+        """304 when If-None-Match matches, else the best encoding the client accepts"""
+        if request.if_none_match.contains(self.etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(self.body, mimetype='application/json')
+            for encoding, data in self.encoded.items():
+                if request.accept_encodings[encoding]:
+                    response.set_data(data)
+                    response.headers['Content-Encoding'] = encoding
+                    break
+        response.set_etag(self.etag)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.no_cache = True
+        return response
+
+class HeritageCatalogue:
+    """
+    Immutable snapshot of the heritage_sites table, with everything the
+    heritage endpoints need precomputed: id lookup, the wheelchair-accessible
+    subset and the name index. A reload builds a new snapshot and swaps the
+    module-level reference, so readers never see a half-built catalogue.
+    """
+
+    def __init__(self, version, sites, aliases):
+        self.version = version
+        self.sites = tuple(sites)
+        self.by_id = MappingProxyType({site['id']: site for site in self.sites})
+        self.wheelchair_sites = tuple(site for site in self.sites if site['isWheelchairAccessible'])
+        self.name_index = SiteNameIndex(self.sites, aliases)
+        self._responses = {}
+
+    def prepared_response(self, key, build_payload):
+        """The PreparedResponse for key, built on first use for this snapshot"""
+        prepared = self._responses.get(key)
+        if prepared is None:
+            prepared = self._responses[key] = PreparedResponse(build_payload())
+        return prepared
+
+def catalogue_version(conn):
+    return conn.execute('SELECT version FROM catalogue_version WHERE id = 1').fetchone()[0]
+
+def load_catalogue(conn):
+    version = catalogue_version(conn)
+    sites, aliases = [], {}
+    for row in conn.execute(f'SELECT {HERITAGE_COLUMNS} FROM heritage_sites ORDER BY id'):
+        sites.append({
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'historicalPeriod': row['historical_period'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'isWheelchairAccessible': bool(row['is_wheelchair_accessible']),
+            'imageUrl': row['image_url'],
+        })
+        if row['aliases']:
+            aliases[row['id']] = json.loads(row['aliases'])
+    return HeritageCatalogue(version, sites, aliases)
+
+def refresh_catalogue(force=False):
+    """Reload the catalogue snapshot if heritage_sites changed. Returns True on reload."""
+    global catalogue
+    conn = db_pool.connect()
+    try:
+        if not force and catalogue_version(conn) == catalogue.version:
+            return False
+        catalogue = load_catalogue(conn)
+        return True
+    finally:
+        conn.close()
+
+def watch_catalogue():
+    while True:
+        time.sleep(CATALOGUE_REFRESH_SECONDS)
+        try:
+            refresh_catalogue()
+        except sqlite3.Error as e:
+            app.logger.warning('Catalogue refresh failed: %s', e)
+
+def read_heritage_records(path):
+    """Yield site dicts from a CSV (header row) or NDJSON file"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def import_heritage_sites(conn, records, replace=False):
+    """
+    Bulk-load heritage sites in one transaction. Records use the API field
+    names (or the column names); rows with an existing id are replaced.
+    Returns the number of rows written.
+    """
+    def truthy(value):
+        return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+    def rows():
+        for record in records:
+            aliases = record.get('aliases') or []
+            if isinstance(aliases, str):
+                aliases = [a.strip() for a in aliases.split('|') if a.strip()]
+            yield heritage_row({
+                'id': int(record['id']) if record.get('id') else None,
+                'name': record['name'],
+                'description': record.get('description'),
+                'historicalPeriod': record.get('historicalPeriod', record.get('historical_period')),
+                'latitude': float(record['latitude']) if record.get('latitude') not in (None, '') else None,
+                'longitude': float(record['longitude']) if record.get('longitude') not in (None, '') else None,
+                'isWheelchairAccessible': truthy(record.get('isWheelchairAccessible', record.get('is_wheelchair_accessible', False))),
+                'imageUrl': record.get('imageUrl', record.get('image_url')),
+            }, aliases)
+
+    c = conn.cursor()
+    if replace:
+        c.execute('DELETE FROM heritage_sites')
+    c.executemany(f'''
+        INSERT OR REPLACE INTO heritage_sites ({HERITAGE_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows())
+    count = c.rowcount
+    conn.commit()
+    return count
+
+def derive_password_key(scheme, params, password, salt):
+    """Hex key for a password; runs in the hashing process pool"""
+    if scheme == 'pbkdf2_sha256':
+        (iterations,) = params
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    if scheme == 'scrypt':
+        n, r, p = params
+        return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=64 * 1024 * 1024, dklen=32).hex()
+    raise ValueError(f'Unknown password scheme: {scheme}')
+
+def parse_password_hash(password_hash):
+    """
+    Split a stored hash into (scheme, params, salt, key). Formats:
+        pbkdf2_sha256$<iterations>$<salt>$<key>
+        scrypt$<n>$<r>$<p>$<salt>$<key>
+        <salt>$<key>  (legacy: PBKDF2-SHA256, 100,000 iterations)
+    """
+    parts = password_hash.split('$')
+    if len(parts) == 2:
+        return 'pbkdf2_sha256', (100000,), parts[0], parts[1]
+    if parts[0] == 'pbkdf2_sha256' and len(parts) == 4:
+        return 'pbkdf2_sha256', (int(parts[1]),), parts[2], parts[3]
+    if parts[0] == 'scrypt' and len(parts) == 6:
+        return 'scrypt', tuple(int(v) for v in parts[1:4]), parts[4], parts[5]
+    raise ValueError('Unrecognised password hash format')
+
+def current_password_params():
+    if PASSWORD_SCHEME == 'scrypt':
+        return 'scrypt', SCRYPT_PARAMS
+    return 'pbkdf2_sha256', (PBKDF2_ITERATIONS,)
+
+class WorkerPoolBusy(Exception):
+    """All workers and queue slots of a WorkerPool are taken, or a call timed out"""
+
+    def __init__(self, message='Server busy, please try again shortly'):
+        super().__init__(message)
+
+class PasswordHasherBusy(WorkerPoolBusy):
+    """All hashing workers and queue slots are taken"""
+
+class WorkerPool:
+    """
+    Runs CPU-bound functions in worker processes, so a burst of them cannot
+    pin the request threads. At most workers calls run at once and
+    max_pending more wait; beyond that busy_error is raised immediately so
+    the caller can answer 503 instead of queueing, as it is for a call with
+    no result after timeout seconds. With workers=0 calls run inline.
+
+    The app's pools share one executor forked by fork_worker_pools() at
+    import, before any thread is started: a child forked from a threaded
+    process can inherit a lock another thread held. It has a process for
+    each worker of every pool, so a pool under its limit always finds one
+    free. A pool not handed an executor forks its own on first use.
+    """
+
+    busy_error = WorkerPoolBusy
+
+    def __init__(self, workers, max_pending, timeout=30):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + max_pending) if workers else None
+        self._running = threading.BoundedSemaphore(workers) if workers else None
+        self._pool = None
+        self._owns_pool = False
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+                self._owns_pool = True
+            return self._pool
+
+    def run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise self.busy_error()
+        timed_out = self.busy_error(f'Server busy, no worker finished within {self.timeout:g}s; please try again shortly')
+        try:
+            deadline = time.monotonic() + self.timeout
+            if not self._running.acquire(timeout=self.timeout):
+                raise timed_out
+            try:
+                future = self._executor().submit(fn, *args)
+                try:
+                    return future.result(timeout=max(deadline - time.monotonic(), 0))
+                except TimeoutError:
+                    future.cancel()
+                    raise timed_out
+            finally:
+                self._running.release()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._owns_pool:
+                self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+def fork_worker_pools(*pools):
+    """Fork one shared executor for pools now; returns it (None when every pool runs inline)"""
+    workers = sum(pool.workers for pool in pools)
+    if not workers:
+        return None
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+    executor.submit(int).result()
+    for pool in pools:
+        if pool.workers:
+            pool._pool = executor
+    return executor
+
+class PasswordHasher(WorkerPool):
+    """Password key derivation off the request threads"""
+
+    busy_error = PasswordHasherBusy
+
+    def derive(self, scheme, params, password, salt):
+        started = time.perf_counter()
+        try:
+            return self.run(derive_password_key, scheme, params, password, salt)
+        finally:
+            metrics.observe('cityconnect_password_hash_duration_seconds', time.perf_counter() - started, (scheme,))
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE)
+image_workers = WorkerPool(IMAGE_WORKERS, IMAGE_QUEUE)
+
+def hash_password(password):
+    scheme, params = current_password_params()
+    salt = secrets.token_hex(16)
+    key = password_hasher.derive(scheme, params, password, salt)
+    return '$'.join([scheme, *(str(v) for v in params), salt, key])
+
+def verify_password(password, password_hash):
+    try:
+        scheme, params, salt, key = parse_password_hash(password_hash)
+    except ValueError:
+        return False
+    password_check = password_hasher.derive(scheme, params, password, salt)
+    return hmac.compare_digest(password_check, key)
+
+def password_needs_rehash(password_hash):
+    """True when a stored hash uses an older format, scheme or cost"""
+    try:
+        scheme, params, _, _ = parse_password_hash(password_hash)
+    except ValueError:
+        return True
+    # Legacy salt$key hashes carry no scheme prefix
+    return password_hash.count('$') == 1 or (scheme, params) != current_password_params()
+
+def create_token(user_id, email, username):
+    payload = {
+        'user_id': user_id,
+        'email': email,
+        'username': username,
+        'exp': datetime.utcnow() + timedelta(days=30)
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+
+class TokenCache:
+    """
+    Bounded LRU of verified JWTs, keyed by SHA-256 digest, mapping to their
+    decoded claims so repeat requests skip signature verification. Entries
+    expire at the token's exp. Revoked digests are evicted and refused until
+    their exp passes. Revocations are stored in revoked_tokens; this cache
+    only remembers the ones this process has seen.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> claims
+        self._revoked = {}  # digest -> exp
+        self._lock = threading.Lock()
+
+    def get(self, digest, now):
+        with self._lock:
+            claims = self._entries.get(digest)
+            if claims is not None and claims.get('exp', 0) > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return claims
+            if claims is not None:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, digest, claims):
+        with self._lock:
+            if digest in self._revoked:
+                return
+            self._entries[digest] = claims
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def revoke(self, digest, exp):
+        now = time.time()
+        with self._lock:
+            self._entries.pop(digest, None)
+            self._revoked[digest] = exp
+            for key in [k for k, e in self._revoked.items() if e <= now]:
+                del self._revoked[key]
+
+    def is_revoked(self, digest):
+        with self._lock:
+            return digest in self._revoked
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'revoked': len(self._revoked),
+            }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).digest()
+
+def verify_token(token):
+    """
+    Claims of a valid, unrevoked token that has an exp, else None. Cache
+    misses are checked against revoked_tokens, since the logout may have
+    reached another worker.
+    """
+    started = time.perf_counter()
+    digest = token_digest(token)
+    claims = token_cache.get(digest, time.time())
+    if claims is not None:
+        metrics.observe('cityconnect_jwt_verify_duration_seconds', time.perf_counter() - started, ('hit',))
+        return claims
+    if token_cache.is_revoked(digest):
+        return None
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=['HS256'], options={'require': ['exp']})
+    except:
+        return None
+    finally:
+        metrics.observe('cityconnect_jwt_verify_duration_seconds', time.perf_counter() - started, ('miss',))
+    # A short checkout unless the request already holds one: this runs before
+    # every authenticated route, and a connection kept until teardown would
+    # be held through a detection
+    held = g.get('db')
+    conn = held or db_pool.acquire()
+    try:
+        revoked = conn.execute('SELECT 1 FROM revoked_tokens WHERE digest = ?', (digest,)).fetchone()
+    finally:
+        if held is None:
+            db_pool.release(conn)
+    if revoked:
+        token_cache.revoke(digest, claims['exp'])
+        return None
+    token_cache.put(digest, claims)
+    return claims
+
+def watch_revocations(last_id):
+    """Evict tokens logged out through other workers from this worker's cache"""
+    conn = db_pool.connect()
+    while True:
+        time.sleep(TOKEN_REVOCATION_POLL_SECONDS)
+        try:
+            rows = conn.execute(
+                'SELECT id, digest, exp FROM revoked_tokens WHERE id > ? ORDER BY id', (last_id,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            app.logger.warning('Revocation poll failed: %s', e)
+            continue
+        for row in rows:
+            token_cache.revoke(row['digest'], row['exp'])
+            last_id = row['id']
+
+def get_bearer_token():
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None
+    parts = auth_header.split(' ')
+    return parts[1] if len(parts) > 1 else None
+
+def get_current_user():
+    token = get_bearer_token()
+    if not token:
+        return None
+    return verify_token(token)
+
+def parse_rate(budget):
+    """'<requests>/<seconds>' as (capacity, tokens per second), or None when unlimited"""
+    if not budget:
+        return None
+    count, _, seconds = budget.partition('/')
+    capacity = int(count)
+    if capacity < 1:
+        return None
+    return capacity, capacity / float(seconds or 1)
+
+class MemoryBucketStore:
+    """
+    Token buckets held in this process. The least recently used buckets
+    beyond max_keys are dropped, which can only refill them early.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite file, so every worker process on the host
+    draws from the same buckets. A take is one atomic UPSERT. Buckets idle
+    for longer than max_idle seconds, which must exceed the longest budget
+    window so they are full by then, are pruned now and then.
+    """
+
+    TAKE = '''
+        INSERT INTO rate_buckets (key, tokens, updated, allowed) VALUES (:key, :capacity - 1, :now, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            tokens = MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate)
+                - (MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) >= 1),
+            allowed = MIN(:capacity, tokens + MAX(:now - updated, 0) * :rate) >= 1,
+            updated = :now
+        RETURNING tokens, allowed
+    '''
+
+    def __init__(self, path, max_idle=86400, prune_every=10000):
+        self.path = path
+        self.max_idle = max_idle
+        self.prune_every = prune_every
+        self._takes = 0
+        self._local = threading.local()
+        self._connect().execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # losing recent takes in a crash is harmless
+            conn.execute('PRAGMA busy_timeout=1000')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, now):
+        conn = self._connect()
+        tokens, allowed = conn.execute(self.TAKE, {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}).fetchone()
+        self._takes += 1
+        if self._takes % self.prune_every == 0:
+            conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - self.max_idle,))
+        return 0.0 if allowed else (1 - tokens) / rate
+
+class RateLimiter:
+    """
+    Token-bucket rate limits. Each (budget, identity) pair has a bucket of
+    capacity tokens refilled at rate per second, and a request takes one.
+    The store holds the buckets: any object with take(key, capacity, rate,
+    now) returning the seconds until a token is free (0 when one was taken).
+    If the store fails, requests are let through.
+    """
+
+    def __init__(self, store, budgets):
+        self.store = store
+        self.budgets = {name: parse_rate(budget) for name, budget in budgets.items()}
+
+    def check(self, budget, identity):
+        """Whole seconds to wait before retrying, or 0 if the request may proceed"""
+        limit = self.budgets.get(budget)
+        if limit is None:
+            return 0
+        capacity, rate = limit
+        try:
+            wait = self.store.take(f'{budget}:{identity}', capacity, rate, time.time())
+        except sqlite3.Error as e:
+            app.logger.warning('Rate limit store unavailable: %s', e)
+            return 0
+        return math.ceil(wait) if wait > 0 else 0
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash_encode(lat, lng, precision):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+def geohash_cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def geohash_cells(min_lat, min_lng, max_lat, max_lng, precision):
+    """
+    {geohash: (centre_lat, centre_lng)} covering a bbox. Raises ValueError
+    when that is more than HEATMAP_MAX_CELLS cells.
+    """
+    height, width = geohash_cell_size(precision)
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0 - 1e-9)
+    min_lng, max_lng = max(min_lng, -180.0), min(max_lng, 180.0 - 1e-9)
+    first_row, last_row = math.floor((min_lat + 90) / height), math.floor((max_lat + 90) / height)
+    first_col, last_col = math.floor((min_lng + 180) / width), math.floor((max_lng + 180) / width)
+    if (last_row - first_row + 1) * (last_col - first_col + 1) > HEATMAP_MAX_CELLS:
+        raise ValueError('bbox covers too many cells; zoom in or lower the precision')
+    cells = {}
+    for row in range(first_row, last_row + 1):
+        lat = -90 + (row + 0.5) * height
+        for col in range(first_col, last_col + 1):
+            lng = -180 + (col + 0.5) * width
+            cells[geohash_encode(lat, lng, precision)] = (lat, lng)
+    return cells
+
+def bump_issue_rollups(c, category, status, lat, lng, delta):
+    """Add delta to the dashboard counters of one issue, in the caller's transaction"""
+    c.execute('''
+        INSERT INTO issue_counts (category, status, count) VALUES (?, ?, ?)
+        ON CONFLICT (category, status) DO UPDATE SET count = count + excluded.count
+    ''', (category, status, delta))
+    cell = geohash_encode(lat, lng, HEATMAP_MAX_PRECISION)
+    c.executemany('''
+        INSERT INTO issue_geo_counts (precision, geohash, category, status, count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (precision, geohash, category, status) DO UPDATE SET count = count + excluded.count
+    ''', [(p, cell[:p], category, status, delta) for p in range(1, HEATMAP_MAX_PRECISION + 1)])
+
+def rebuild_issue_rollups(c):
+    """Recompute the dashboard counters from issue_reports"""
+    c.execute('DELETE FROM issue_counts')
+    c.execute('DELETE FROM issue_geo_counts')
+    c.execute('''
+        INSERT INTO issue_counts (category, status, count)
+        SELECT category, COALESCE(status, 'pending'), COUNT(*) FROM issue_reports
+        GROUP BY category, COALESCE(status, 'pending')
+    ''')
+    counts = defaultdict(int)
+    for category, status, lat, lng in c.execute(
+        "SELECT category, COALESCE(status, 'pending'), latitude, longitude FROM issue_reports"
+    ).fetchall():
+        cell = geohash_encode(lat, lng, HEATMAP_MAX_PRECISION)
+        for p in range(1, HEATMAP_MAX_PRECISION + 1):
+            counts[(p, cell[:p], category, status)] += 1
+    c.executemany(
+        'INSERT INTO issue_geo_counts (precision, geohash, category, status, count) VALUES (?, ?, ?, ?, ?)',
+        [key + (count,) for key, count in counts.items()]
+    )
+
+class ChangeFeed:
+    """
+    Fan-out of the issue_changes log to stream subscribers.
+
+    One poller thread tails the log and keeps the newest events, already
+    rendered as SSE frames, in a ring buffer. Subscribers only hold the last
+    sequence number they sent and sleep on a shared condition, so an idle
+    subscriber costs a waiting thread and no database work. Subscribers
+    that fall behind the buffer catch up from the table. Past
+    max_subscribers, subscribe() refuses so streams cannot take every
+    request thread.
+    """
+
+    def __init__(self, buffer_size, poll_interval, max_subscribers):
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self.last_seq = 0
+        self.subscribers = 0
+
+    @staticmethod
+    def frame(row):
+        return f"id: {row['seq']}\nevent: {row['event']}\ndata: {row['data']}\n\n"
+
+    def read(self, conn, after_seq, limit=500):
+        """[(seq, frame)] from the log after after_seq"""
+        rows = conn.execute(
+            'SELECT seq, event, data FROM issue_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+            (after_seq, limit)
+        ).fetchall()
+        return [(row['seq'], self.frame(row)) for row in rows]
+
+    def poll(self, conn):
+        while True:
+            events = self.read(conn, self.last_seq)
+            if not events:
+                return
+            with self._cond:
+                self._events.extend(events)
+                self.last_seq = events[-1][0]
+                self._cond.notify_all()
+
+    def wake(self):
+        """Poll now instead of at the next interval (after a local write)"""
+        self._wake.set()
+
+    def start(self, conn):
+        """Tail the log from its current end on a background thread"""
+        conn.execute('PRAGMA query_only=ON')
+        self.last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM issue_changes').fetchone()[0]
+        threading.Thread(target=self._run, args=(conn,), name='change-feed', daemon=True).start()
+
+    def _run(self, conn):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll(conn)
+            except sqlite3.Error as e:
+                app.logger.warning('Change feed poll failed: %s', e)
+
+    def wait(self, after_seq, timeout):
+        """
+        Buffered events after after_seq, waiting up to timeout for one.
+        Returns None when the buffer does not reach back to after_seq (it
+        starts empty), so the caller reads the log instead.
+        """
+        with self._cond:
+            if after_seq >= self.last_seq:
+                self._cond.wait(timeout)
+                if after_seq >= self.last_seq:
+                    return []
+            if not self._events or after_seq < self._events[0][0] - 1:
+                return None
+            pending = []
+            for seq, frame in reversed(self._events):
+                if seq <= after_seq:
+                    break
+                pending.append((seq, frame))
+            pending.reverse()
+            return pending
+
+    def subscribe(self):
+        """Take a subscriber slot; False when all max_subscribers are in use"""
+        with self._cond:
+            if self.subscribers >= self.max_subscribers:
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def stats(self):
+        return {
+            'lastSeq': self.last_seq,
+            'buffered': len(self._events),
+            'subscribers': self.subscribers,
+        }
+
+# ==================== INITIALIZATION ====================
+
+# Fork the process pools before any thread is started
+worker_processes = fork_worker_pools(password_hasher, image_workers)
+vision_loop = VisionLoop()
+
+init_db()
+
+detection_cache = DetectionCache(DETECT_CACHE_SIZE, DETECT_CACHE_TTL, DETECT_CACHE_MAX_DISTANCE)
+detection_jobs = JobQueue(DETECT_WORKERS, DETECT_QUEUE_SIZE, DETECT_JOB_TIMEOUT, db_pool.connect)
+detection_flight = SingleFlight()
+detect_slots = threading.BoundedSemaphore(DETECT_MAX_INFLIGHT)
+
+_conn = db_pool.connect()
+detection_cache.load(_conn)
+catalogue = load_catalogue(_conn)
+_last_revocation = _conn.execute('SELECT COALESCE(MAX(id), 0) FROM revoked_tokens').fetchone()[0]
+_conn.close()
+threading.Thread(target=watch_catalogue, name='catalogue-watcher', daemon=True).start()
+threading.Thread(target=watch_revocations, args=(_last_revocation,), name='revocation-watcher', daemon=True).start()
+
+change_feed = ChangeFeed(CHANGE_FEED_BUFFER, CHANGE_FEED_POLL_SECONDS, CHANGE_FEED_MAX_SUBSCRIBERS)
+
+if RATE_LIMIT_STORE == 'sqlite':
+    bucket_store = SQLiteBucketStore(RATE_LIMIT_DB)
+else:
+    bucket_store = MemoryBucketStore()
+rate_limiter = RateLimiter(bucket_store, RATE_LIMITS) if RATE_LIMIT_ENABLED else None
+admission_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS) if MAX_CONCURRENT_REQUESTS else None
+change_feed.start(db_pool.connect())
+
+metrics.gauge('cityconnect_change_feed_subscribers', 'Open /api/issues/stream connections', fn=lambda: {(): change_feed.subscribers})
+metrics.gauge('cityconnect_detect_jobs_pending', 'Background detections waiting for a worker', fn=lambda: {(): detection_jobs.pending()})
+
+def flush_metrics():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            metrics.dump(metrics_file)
+        except OSError as e:
+            app.logger.warning('Metrics flush failed: %s', e)
+
+metrics_file = os.path.join(METRICS_DIR, f'{os.getpid()}-{secrets.token_hex(4)}.json') if METRICS_DIR else None
+if metrics_file:
+    threading.Thread(target=flush_metrics, name='metrics-flusher', daemon=True).start()
+
+def shutdown_background_work():
+    """Stop the worker pools and close the vision client and database connections"""
+    if metrics_file:
+        metrics.dump(metrics_file, gauges=False)
+    password_hasher.shutdown()
+    image_workers.shutdown()
+    if worker_processes is not None:
+        worker_processes.shutdown(cancel_futures=True)
+    vision_loop.close(client)
+    db_pool.close()
+
+@app.cli.command('migrate-photos')
+@click.option('--vacuum', is_flag=True, help='Reclaim the freed space afterwards')
+def migrate_photos_command(vacuum):
+    """Move photos stored in issue_reports into the blob store"""
+    conn = db_pool.connect()
+    moved = migrate_photos_to_blob_store(conn)
+    click.echo(f'Moved {moved} photos to {PHOTO_STORE_DIR}')
+    if vacuum:
+        conn.execute('VACUUM')
+    conn.close()
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the issue stats and heatmap counters from scratch"""
+    conn = db_pool.connect()
+    started = time.perf_counter()
+    with conn:
+        rebuild_issue_rollups(conn.cursor())
+    conn.close()
+    click.echo(f'Rebuilt issue rollups in {time.perf_counter() - started:.1f}s')
+
+@app.cli.command('import-heritage')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Delete the existing catalogue first')
+def import_heritage_command(path, replace):
+    """Bulk-import heritage sites from a CSV or NDJSON file"""
+    conn = db_pool.connect()
+    started = time.perf_counter()
+    count = import_heritage_sites(conn, read_heritage_records(path), replace=replace)
+    conn.close()
+    click.echo(f'Imported {count} heritage sites in {time.perf_counter() - started:.1f}s')
+
+# ==================== AUTHENTICATION ENDPOINTS ====================
+
+def password_hasher_busy_response(message='Server busy, please try again shortly'):
+    response = jsonify({'success': False, 'message': message})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    """Login user"""
+    try:
+        data = request.get_json()
+        email = data.get('email')
+        password = data.get('password')
+        
+        if not email or not password:
+            return jsonify({'success': False, 'message': 'Email and password required'}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT * FROM users WHERE email = ?', (email,))
+        user = c.fetchone()
+        
+        if not user or not verify_password(password, user['password_hash']):
+            return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+        
+        # Transparently move the stored hash to the current scheme and cost
+        if password_needs_rehash(user['password_hash']):
+            c.execute('UPDATE users SET password_hash = ? WHERE id = ?', (hash_password(password), user['id']))
+            conn.commit()
+        
+        token = create_token(user['id'], user['email'], user['username'])
+        return jsonify({
+            'success': True,
+            'token': token,
+            'userId': user['id'],
+            'username': user['username'],
+            'email': user['email']
+        }), 200
+    
+    except PasswordHasherBusy as e:
+        return password_hasher_busy_response(str(e))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/auth/signup', methods=['POST'])
+def signup():
+    """Sign up new user"""
+    try:
+        data = request.get_json()
+        email = data.get('email')
+        password = data.get('password')
+        
+        if not email or not password:
+            return jsonify({'success': False, 'message': 'Email and password required'}), 400
+        
+        password_hash = hash_password(password)
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        try:
+            c.execute('''
+                INSERT INTO users (email, password_hash, username)
+                VALUES (?, ?, ?)
+            ''', (email, password_hash, email.split('@')[0]))
+            conn.commit()
+            
+            user_id = c.lastrowid
+            token = create_token(user_id, email, email.split('@')[0])
+            
+            return jsonify({
+                'success': True,
+                'token': token,
+                'userId': user_id,
+                'username': email.split('@')[0],
+                'email': email
+            }), 201
+        
+        except sqlite3.IntegrityError:
+            return jsonify({'success': False, 'message': 'Email already exists'}), 409
+    
+    except PasswordHasherBusy as e:
+        return password_hasher_busy_response(str(e))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """Revoke the bearer token"""
+    token = get_bearer_token()
+    claims = verify_token(token) if token else None
+    if not claims:
+        return jsonify({'success': False, 'message': 'Invalid or missing token'}), 401
+    digest, exp = token_digest(token), claims['exp']
+    conn = get_db()
+    conn.execute('DELETE FROM revoked_tokens WHERE exp <= ?', (time.time(),))
+    conn.execute('INSERT OR IGNORE INTO revoked_tokens (digest, exp) VALUES (?, ?)', (digest, exp))
+    conn.commit()
+    token_cache.revoke(digest, exp)
+    return jsonify({'success': True, 'message': 'Logged out'}), 200
+
+@app.route('/api/auth/stats', methods=['GET'])
+def get_auth_stats():
+    """Verified-token cache counters"""
+    return jsonify({'tokenCache': token_cache.stats()}), 200
+
+# ==================== HERITAGE ENDPOINTS ====================
+
+def detect_with_model(image_base64, mime_type):
+    """Ask Claude Vision whether the image shows a heritage site (blocks until it answers)"""
+    return vision_loop.run(detect_with_model_async(image_base64, mime_type), VISION_TIMEOUT)
+
+async def detect_with_model_async(image_base64, mime_type):
+    metrics.observe('cityconnect_vision_request_size_bytes', len(image_base64))
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        message = await vision_request(image_base64, mime_type)
+        outcome = 'ok'
+    finally:
+        metrics.observe('cityconnect_vision_request_duration_seconds', time.perf_counter() - started, (outcome,))
+
+    response_text = ""
+    for block in message.content:
+        if block.type == "text":
+            response_text += block.text
+
+    json_text = extract_json(response_text)
+    return json.loads(json_text)
+
+def vision_request(image_base64, mime_type):
+    """The model call itself, as a coroutine"""
+    return client.messages.create(
+        model="claude-sonnet-4-5-20250929",
+        max_tokens=1024,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": mime_type,
+                            "data": image_base64,
+                        },
+                    },
+                    {
+                        "type": "text",
+                        "text": """Analyze this image and respond ONLY in JSON:
+                        {
+                            "detected": true/false,
+                            "siteName": "name",
+                            "confidence": 0.95,
+                            "description": "text"
+                        }"""
+                    }
+                ],
+            }
+        ],
+    )
+
+def match_detection(detection_result):
+    """Match a detection result against the catalogue and build the response body"""
+    if detection_result.get('detected'):
+        site_name = detection_result.get('siteName', '')
+        matching_site, score = catalogue.name_index.match(site_name, SITE_MATCH_MIN_SCORE)
+        if matching_site:
+            return {'detected': True, 'site': matching_site, 'matchConfidence': round(score, 3)}
+        else:
+            return {'detected': True, 'site': {
+                'id': 999,
+                'name': detection_result.get('siteName', 'Heritage Site'),
+                'description': detection_result.get('description', 'A historic landmark'),
+                'historicalPeriod': 'Historic',
+                'isWheelchairAccessible': False,
+                'latitude': 3.1413,
+                'longitude': 101.6964
+            }}
+    else:
+        return {'detected': False, 'message': 'No heritage site detected'}
+
+def detect_and_cache(image_base64, mime_type, phash):
+    detection_result = detect_with_model(image_base64, mime_type)
+    if phash is not None:
+        detection_cache.store(phash, detection_result, get_db())
+    return detection_result
+
+def run_detection(image_base64, mime_type):
+    """
+    Detect the heritage site in an image, answering near-duplicates from
+    the perceptual-hash cache. Identical images already being detected
+    share that in-flight model call. Needs an app context for the cache write.
+    """
+    try:
+        phash = image_dhash(decode_photo(image_base64))
+    except (ValueError, OSError, Image.DecompressionBombError):
+        phash = None  # Not decodable here; leave it to the model
+
+    detection_result = detection_cache.lookup(phash) if phash is not None else None
+    if detection_result is None:
+        key = (hashlib.sha256(image_base64.encode()).hexdigest(), mime_type)
+        detection_result = detection_flight.do(key, detect_and_cache, image_base64, mime_type, phash)
+
+    return match_detection(detection_result)
+
+def run_detection_job(image_base64, mime_type):
+    with app.app_context():
+        return run_detection(image_base64, mime_type)
+
+def prepare_detection_image(source):
+    """An image (bytes or a file path) normalized for the vision model, as (base64, mime type)"""
+    processed = image_workers.run(normalize_image, source, DETECT_MAX_DIMENSION)
+    return base64.b64encode(processed['data']).decode('ascii'), processed['mimeType']
+
+@app.route('/api/heritage/detect', methods=['POST'])
+def detect_heritage():
+    """
+    Hybrid: Use in-memory sites for matching, Claude for detection.
+    With ?async=1 the detection is queued and a job id returned immediately.
+    The image is imageBase64 in a JSON body, an 'image' file in
+    multipart/form-data, or the raw image/* body.
+    """
+    try:
+        try:
+            upload = image_upload('image')
+            if upload is None:
+                data = request_json()
+                image_base64 = data.get('imageBase64')
+                mime_type = data.get("mimeType", "image/jpeg")
+                image = decode_photo(image_base64) if image_base64 else b''
+                if sniff_image_type(image[:12]):
+                    try:
+                        image_base64, mime_type = prepare_detection_image(image)
+                    except (OSError, Image.DecompressionBombError):
+                        pass  # Not decodable here; leave it to the model
+            else:
+                with tempfile.NamedTemporaryFile(prefix='cityconne-upload-') as f:
+                    save_image_upload(upload[0], f)
+                    try:
+                        image_base64, mime_type = prepare_detection_image(f.name)
+                    except (OSError, Image.DecompressionBombError):
+                        raise ValueError('Could not decode image')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except UploadTooLarge:
+            return upload_too_large_response()
+        except RequestEntityTooLarge:
+            return request_too_large_response()
+        except WorkerPoolBusy as e:
+            return server_busy_response(str(e))
+
+        if not image_base64:
+            return jsonify({'error': 'Image data required'}), 400
+
+        if request.args.get('async') in ('1', 'true'):
+            try:
+                job_id = detection_jobs.submit(get_db(), run_detection_job, image_base64, mime_type)
+            except queue.Full:
+                response = jsonify({'error': 'Detection queue is full, try again shortly'})
+                response.headers['Retry-After'] = '5'
+                return response, 429
+            return jsonify({
+                'jobId': job_id,
+                'status': 'queued',
+                'statusUrl': f'/api/heritage/detect/jobs/{job_id}'
+            }), 202
+
+        if not detect_slots.acquire(blocking=False):
+            response = jsonify({'error': 'Too many detections in progress, retry shortly or use ?async=1'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        try:
+            return jsonify(run_detection(image_base64, mime_type)), 200
+        finally:
+            detect_slots.release()
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/heritage/detect/jobs/<job_id>', methods=['GET'])
+def get_detection_job(job_id):
+    """Poll a queued detection; result is set once status is 'done'"""
+    job = detection_jobs.get(get_db(), job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    body = {'jobId': job['id'], 'status': job['status']}
+    if 'result' in job:
+        body['result'] = job['result']
+    if 'error' in job:
+        body['error'] = job['error']
+    return jsonify(body), 200
+
+@app.route('/api/heritage/detect/stats', methods=['GET'])
+def get_detection_stats():
+    """Detection cache, coalescing and job queue counters, for tuning"""
+    return jsonify({
+        'cache': detection_cache.stats(),
+        'coalescing': detection_flight.stats(),
+        'queue': {'pending': detection_jobs.pending(), 'workers': detection_jobs.workers}
+    }), 200
+
+@app.route('/api/heritage/list', methods=['GET'])
+def get_heritage_list():
+    wheelchair_only = request.args.get('wheelchairOnly', 'false').lower() == 'true'
+    snapshot = catalogue
+    sites = snapshot.wheelchair_sites if wheelchair_only else snapshot.sites
+    return snapshot.prepared_response(
+        ('list', wheelchair_only),
+        lambda: {'sites': list(sites), 'total': len(sites)}
+    ).respond()
+
+@app.route('/api/heritage/<int:site_id>', methods=['GET'])
 def get_heritage_details(site_id):
-    site = next((s for s in HERITAGE_SITES_IN_MEMORY if s['id'] == site_id), None)
+    snapshot = catalogue
+    site = snapshot.by_id.get(site_id)
     if not site:
         return jsonify({'error': 'Heritage site not found'}), 404
-    return jsonify(site), 200
+    return snapshot.prepared_response(('site', site_id), lambda: site).respond()
+
+
+# ==================== ISSUE ENDPOINTS ====================
+
+# Every issue column except the legacy inline photo_base64
+ISSUE_COLUMNS = '''id, user_id, category, photo_sha256, photo_size, latitude, longitude,
+    address, description, status, cluster_id, created_at, updated_at'''
+
+# API field name -> column, in response order, for ?fields= projections
+ISSUE_FIELDS = {
+    'id': 'id',
+    'category': 'category',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+    'address': 'address',
+    'description': 'description',
+    'status': 'status',
+    'photoSha256': 'photo_sha256',
+    'photoSize': 'photo_size',
+    'clusterId': 'cluster_id',
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at',
+}
+
+# Fields returned for a newly created issue
+ISSUE_CREATED_FIELDS = ['id', 'category', 'latitude', 'longitude', 'address', 'description',
+                        'status', 'clusterId', 'createdAt']
+
+ISSUES_PAGE_DEFAULT = 100
+ISSUES_PAGE_MAX = 500
+ISSUES_BATCH_MAX = 50
+
+def parse_issue_fields(fields_arg):
+    """Validate a comma-separated ?fields= value; all fields when empty"""
+    if not fields_arg:
+        return list(ISSUE_FIELDS)
+    fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in ISSUE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def issue_select_columns(fields, required=('id', 'created_at')):
+    """Columns for a projection, always including the keyset columns"""
+    columns = [ISSUE_FIELDS[f] for f in fields]
+    for key in required:
+        if key not in columns:
+            columns.append(key)
+    return ', '.join(columns)
+
+def issue_to_dict(row, fields):
+    return {f: row[ISSUE_FIELDS[f]] for f in fields}
+
+def parse_limit(limit_arg):
+    try:
+        limit = int(limit_arg) if limit_arg else ISSUES_PAGE_DEFAULT
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, ISSUES_PAGE_MAX))
+
+def encode_cursor(*values):
+    """Opaque keyset cursor for the page after the row with these sort keys"""
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, types=(str, int)):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(types):
+            raise ValueError
+        return tuple(cast(value) for cast, value in zip(types, values))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def fts_query(text):
+    """Turn free text into a safe FTS5 query: all words, the last as a prefix"""
+    terms = re.findall(r'\w+', text or '')
+    if not terms:
+        raise ValueError('q must contain at least one word')
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+EARTH_RADIUS_M = 6371008.8
+NEARBY_DEFAULT_RADIUS_M = 1000
+NEARBY_MAX_RADIUS_M = 50000
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+def radius_bbox(lat, lng, radius_m):
+    """(min_lat, min_lng, max_lat, max_lng) enclosing a circle"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * max(math.cos(math.radians(lat)), 1e-6)))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+def bbox_span_m(min_lat, min_lng, max_lat, max_lng):
+    """(width, height) of a bbox in metres, the width taken at its centre latitude"""
+    height = math.radians(max_lat - min_lat) * EARTH_RADIUS_M
+    width = math.radians(max_lng - min_lng) * EARTH_RADIUS_M * math.cos(math.radians((min_lat + max_lat) / 2))
+    return width, height
+
+def parse_bbox(bbox_arg):
+    """Parse bbox=minLng,minLat,maxLng,maxLat into (min_lat, min_lng, max_lat, max_lng)"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox_arg.split(','))
+    except ValueError:
+        raise ValueError('bbox must be minLng,minLat,maxLng,maxLat')
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError('bbox must be minLng,minLat,maxLng,maxLat')
+    return min_lat, min_lng, max_lat, max_lng
 
+def parse_float_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == '':
+        if default is None:
+            raise ValueError(f'{name} is required')
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
 
-# ==================== ISSUE ENDPOINTS ====================
+def find_duplicate_cluster(c, category, lat, lng, photo_dhash):
+    """
+    Cluster id of the closest open issue this report duplicates, or None.
+    A cluster stays open until its primary issue is closed. Candidates come
+    from the R*Tree index around the location; when both photos have a
+    dHash they must also be within CLUSTER_MAX_PHOTO_DISTANCE.
+    """
+    if CLUSTER_RADIUS_M <= 0:
+        return None
+    min_lat, min_lng, max_lat, max_lng = radius_bbox(lat, lng, CLUSTER_RADIUS_M)
+    closed = ', '.join('?' * len(ISSUE_CLOSED_STATUSES))
+    c.execute(f'''
+        SELECT r.id, r.cluster_id, r.latitude, r.longitude, r.photo_dhash
+        FROM issue_reports_rtree t
+        CROSS JOIN issue_reports r ON r.id = t.id
+        CROSS JOIN issue_reports primary_issue ON primary_issue.id = r.cluster_id
+        WHERE t.min_lat <= ? AND t.max_lat >= ? AND t.min_lng <= ? AND t.max_lng >= ?
+        AND r.category = ? AND primary_issue.status NOT IN ({closed})
+        AND r.created_at >= datetime('now', ?)
+    ''', (max_lat, min_lat, max_lng, min_lng, category, *ISSUE_CLOSED_STATUSES,
+          f'-{CLUSTER_WINDOW_HOURS} hours'))
+    
+    best = None
+    for row in c.fetchall():
+        distance = haversine_m(lat, lng, row['latitude'], row['longitude'])
+        if distance > CLUSTER_RADIUS_M:
+            continue
+        if photo_dhash and row['photo_dhash']:
+            photo_distance = hamming(int(photo_dhash, 16), int(row['photo_dhash'], 16))
+            if photo_distance > CLUSTER_MAX_PHOTO_DISTANCE:
+                continue
+        else:
+            photo_distance = CLUSTER_MAX_PHOTO_DISTANCE
+        key = (photo_distance, distance, row['id'])
+        if best is None or key < best[0]:
+            best = (key, row['cluster_id'])
+    return best[1] if best else None
+
+def parse_issue_report(data, upload=None):
+    """
+    Validate one issue report body; raises ValueError with the reason.
+    upload is the photo stream of a multipart or raw image request, which
+    is read later by store_issue_photo; otherwise photoBase64 is required.
+    """
+    if not hasattr(data, 'get'):
+        raise ValueError('Issue report must be a JSON object')
+    
+    if not data.get('category') or (upload is None and not data.get('photoBase64')):
+        raise ValueError('Category and photo are required')
+    
+    if data.get('latitude') is None or data.get('longitude') is None:
+        raise ValueError('Location coordinates are required')
+    
+    try:
+        latitude = float(data.get('latitude'))
+        longitude = float(data.get('longitude'))
+    except (TypeError, ValueError):
+        raise ValueError('Location coordinates must be numbers')
+    
+    client_id = data.get('clientId')
+    if client_id is not None and (not isinstance(client_id, str) or not 0 < len(client_id) <= 64):
+        raise ValueError('clientId must be a string of 1 to 64 characters')
+    
+    return {
+        'category': data.get('category'),
+        'photo': decode_photo(data.get('photoBase64')) if upload is None else None,
+        'upload': upload,
+        'latitude': latitude,
+        'longitude': longitude,
+        'address': data.get('address'),
+        'description': data.get('description'),
+        'client_id': client_id,
+    }
+
+def store_issue_photo(report):
+    """
+    Normalize the report's photo in the image workers and write it and its
+    variants to the blob store (outside any transaction). Uploaded streams
+    are spooled to a temp file first, so may raise ValueError or
+    UploadTooLarge part way through. JSON photos that cannot be decoded are
+    stored as sent.
+    """
+    photo = report['photo']
+    if photo is not None and sniff_image_type(photo[:12]) is None:
+        report['photo_sha256'], report['photo_size'] = blob_store.put(photo)
+        report['photo_dhash'] = None
+        return
+    try:
+        if photo is None:
+            with tempfile.NamedTemporaryFile(prefix='cityconne-upload-') as f:
+                save_image_upload(report['upload'], f)
+                processed = image_workers.run(normalize_image, f.name, PHOTO_MAX_DIMENSION, PHOTO_VARIANTS)
+        else:
+            processed = image_workers.run(normalize_image, photo, PHOTO_MAX_DIMENSION, PHOTO_VARIANTS)
+    except (OSError, Image.DecompressionBombError):
+        if photo is None:
+            raise ValueError('Could not decode image')
+        report['photo_sha256'], report['photo_size'] = blob_store.put(photo)
+        report['photo_dhash'] = None
+        return
+    
+    digest, size = blob_store.put(processed['data'])
+    for name, data in processed['variants'].items():
+        path = blob_store.variant_path(digest, name)
+        if not os.path.exists(path):
+            blob_store.write(path, data)
+    report['photo_sha256'], report['photo_size'] = digest, size
+    report['photo_dhash'] = f"{processed['dhash']:016x}"
+
+def insert_issue(c, report, user_id):
+    """
+    Insert a stored report inside the caller's write transaction, joining a
+    near-duplicate cluster when there is one. Returns (issue_id, duplicate_of).
+    A clientId seen before returns the issue it created instead.
+    """
+    if report['client_id']:
+        c.execute('SELECT id, cluster_id FROM issue_reports WHERE client_id = ?', (report['client_id'],))
+        existing = c.fetchone()
+        if existing:
+            duplicate_of = existing['cluster_id'] if existing['cluster_id'] != existing['id'] else None
+            return existing['id'], duplicate_of
+    
+    cluster_id = find_duplicate_cluster(
+        c, report['category'], report['latitude'], report['longitude'], report['photo_dhash']
+    )
+    
+    c.execute('''
+        INSERT INTO issue_reports (user_id, category, photo_sha256, photo_size, photo_dhash, latitude, longitude, address, description, status, cluster_id, client_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        user_id,
+        report['category'],
+        report['photo_sha256'],
+        report['photo_size'],
+        report['photo_dhash'],
+        report['latitude'],
+        report['longitude'],
+        report['address'],
+        report['description'],
+        'pending',
+        cluster_id,
+        report['client_id']
+    ))
+    issue_id = c.lastrowid
+    
+    if cluster_id is None:
+        c.execute('''
+            INSERT INTO issue_clusters (id, category, latitude, longitude, first_reported_at, last_reported_at)
+            SELECT id, category, latitude, longitude, created_at, created_at FROM issue_reports WHERE id = ?
+        ''', (issue_id,))
+        c.execute('UPDATE issue_reports SET cluster_id = id WHERE id = ?', (issue_id,))
+    else:
+        c.execute('''
+            UPDATE issue_clusters
+            SET report_count = report_count + 1, last_reported_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (cluster_id,))
+    
+    bump_issue_rollups(c, report['category'], 'pending', report['latitude'], report['longitude'], 1)
+    return issue_id, cluster_id
 
 @app.route('/api/issues/create', methods=['POST'])
 def create_issue():
-    """Create a new issue report"""
+    """
+    Create a new issue report. The photo is either photoBase64 in a JSON
+    body, a 'photo' file in multipart/form-data, or the raw image/* body
+    (with the other fields in the query string).
+    """
     try:
-        data = request.get_json()
+        try:
+            upload = image_upload('photo')
+            if upload is None:
+                report = parse_issue_report(request_json())
+            else:
+                report = parse_issue_report(upload[1], upload[0])
+            store_issue_photo(report)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except UploadTooLarge:
+            return upload_too_large_response()
+        except RequestEntityTooLarge:
+            return request_too_large_response()
+        except WorkerPoolBusy as e:
+            return server_busy_response(str(e))
+        
+        user = get_current_user()
+        user_id = user['user_id'] if user else None
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Take the write lock before looking for duplicates so two reports of
+        # the same problem arriving together cannot both start a cluster
+        c.execute('BEGIN IMMEDIATE')
+        issue_id, duplicate_of = insert_issue(c, report, user_id)
+        conn.commit()
+        change_feed.wake()
         
-        if not data.get('category') or not data.get('photoBase64'):
-            return jsonify({'error': 'Category and photo are required'}), 400
+        c.execute(f'SELECT {ISSUE_COLUMNS} FROM issue_reports WHERE id = ?', (issue_id,))
+        issue = c.fetchone()
+        
+        return jsonify({
+            'success': True,
+            'issue': issue_to_dict(issue, ISSUE_CREATED_FIELDS),
+            'duplicateOf': duplicate_of,
+            'message': 'Issue report created successfully' if duplicate_of is None
+                else 'Issue already reported; your report was added to it'
+        }), 201
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/batch', methods=['POST'])
+def create_issues_batch():
+    """
+    Upload queued offline reports in one request and one transaction: either
+    every report is stored or none is. Reports carrying a clientId that was
+    already uploaded return the existing issue, so a retried batch is safe.
+    """
+    try:
+        data = request_json()
+        items = data.get('issues') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'issues must be a non-empty list'}), 400
+        if len(items) > ISSUES_BATCH_MAX:
+            return jsonify({'error': f'At most {ISSUES_BATCH_MAX} issues per batch'}), 400
         
-        if data.get('latitude') is None or data.get('longitude') is None:
-            return jsonify({'error': 'Location coordinates are required'}), 400
+        reports = []
+        for index, item in enumerate(items):
+            try:
+                reports.append(parse_issue_report(item))
+            except ValueError as e:
+                return jsonify({'error': f'issues[{index}]: {e}', 'index': index}), 400
         
         user = get_current_user()
         user_id = user['user_id'] if user else None
         
+        try:
+            for report in reports:
+                store_issue_photo(report)
+        except WorkerPoolBusy as e:
+            return server_busy_response(str(e))
+        
         conn = get_db()
         c = conn.cursor()
         
-        c.execute('''
-            INSERT INTO issue_reports (user_id, category, photo_base64, latitude, longitude, address, description, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            data.get('category'),
-            data.get('photoBase64'),
-            data.get('latitude'),
-            data.get('longitude'),
-            data.get('address'),
-            data.get('description'),
-            'pending'
-        ))
-        
+        c.execute('BEGIN IMMEDIATE')
+        created = [insert_issue(c, report, user_id) for report in reports]
         conn.commit()
-        issue_id = c.lastrowid
+        change_feed.wake()
         
-        c.execute('SELECT * FROM issue_reports WHERE id = ?', (issue_id,))
-        issue = c.fetchone()
-        conn.close()
+        ids = [issue_id for issue_id, _ in created]
+        c.execute(
+            f'SELECT {ISSUE_COLUMNS} FROM issue_reports WHERE id IN ({", ".join("?" * len(ids))})',
+            ids
+        )
+        rows = {row['id']: row for row in c.fetchall()}
+        
+        issues = []
+        for report, (issue_id, duplicate_of) in zip(reports, created):
+            issue = issue_to_dict(rows[issue_id], ISSUE_CREATED_FIELDS)
+            issue['clientId'] = report['client_id']
+            issue['duplicateOf'] = duplicate_of
+            issues.append(issue)
         
         return jsonify({
             'success': True,
-            'issue': {
-                'id': issue['id'],
-                'category': issue['category'],
-                'latitude': issue['latitude'],
-                'longitude': issue['longitude'],
-                'address': issue['address'],
-                'description': issue['description'],
-                'status': issue['status'],
-                'createdAt': issue['created_at']
-            },
-            'message': 'Issue report created successfully'
+            'issues': issues,
+            'total': len(issues)
         }), 201
     
+    except RequestEntityTooLarge:
+        return request_too_large_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/issues/list', methods=['GET'])
 def get_issues_list():
-    """Get list of all issue reports"""
+    """
+    Get a page of issue reports, newest first.
+    Pass the returned nextCursor as ?cursor= to fetch the following page;
+    total counts every issue matching the filters, not just this page.
+    """
     try:
         status = request.args.get('status')
         category = request.args.get('category')
         
+        try:
+            fields = parse_issue_fields(request.args.get('fields'))
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         conn = get_db()
         c = conn.cursor()
         
-        query = 'SELECT * FROM issue_reports WHERE 1=1'
+        query = f'SELECT {issue_select_columns(fields)} FROM issue_reports WHERE 1=1'
         params = []
         
         if status:
@@ -425,30 +3317,488 @@ def get_issues_list():
             query += ' AND category = ?'
             params.append(category)
         
-        query += ' ORDER BY created_at DESC'
+        if request.args.get('clusterId'):
+            query += ' AND cluster_id = ?'
+            params.append(request.args.get('clusterId'))
+        
+        if after:
+            query += ' AND (created_at, id) < (?, ?)'
+            params.extend(after)
+        
+        # Fetch one extra row to know whether another page exists
+        query += ' ORDER BY created_at DESC, id DESC LIMIT ?'
+        params.append(limit + 1)
         
         c.execute(query, params)
+        rows = c.fetchall()
+        
+        next_cursor = encode_cursor(rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        issues = [issue_to_dict(row, fields) for row in rows[:limit]]
+        
+        # Status and category totals come from the dashboard rollups
+        filters = [('status', status), ('category', category)]
+        if request.args.get('clusterId'):
+            filters.append(('cluster_id', request.args.get('clusterId')))
+            count_query = 'SELECT COUNT(*) FROM issue_reports WHERE 1=1'
+        else:
+            count_query = 'SELECT COALESCE(SUM(count), 0) FROM issue_counts WHERE 1=1'
+        count_params = []
+        for column, value in filters:
+            if value:
+                count_query += f' AND {column} = ?'
+                count_params.append(value)
+        c.execute(count_query, count_params)
+        total = c.fetchone()[0]
+        
+        return jsonify({
+            'issues': issues,
+            'total': total,
+            'nextCursor': next_cursor
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/changes', methods=['GET'])
+def get_issue_changes():
+    """
+    Delta sync: issues created, updated or deleted after ?since=<version>,
+    oldest change first. Versions are change-log sequence numbers; pass the
+    returned version back as ?since= (again at once while hasMore is true).
+    Deleted issues come back as tombstones in 'deleted'.
+    """
+    try:
+        try:
+            try:
+                since = int(request.args.get('since') or 0)
+            except ValueError:
+                raise ValueError('since must be a version number')
+            fields = parse_issue_fields(request.args.get('fields'))
+            limit = parse_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        # One entry per issue at its latest version; issues on later pages
+        # all have a change newer than this page's last version. Walks the
+        # log forward from since on the primary key and keeps each issue's
+        # last change, so a page costs about limit index probes rather than
+        # a scan of the whole log.
+        c.execute('''
+            SELECT issue_id, seq AS version FROM issue_changes AS change
+            WHERE seq > ?
+            AND NOT EXISTS (
+                SELECT 1 FROM issue_changes AS later
+                WHERE later.issue_id = change.issue_id AND later.seq > change.seq
+            )
+            ORDER BY seq
+            LIMIT ?
+        ''', (since, limit + 1))
+        changed = c.fetchall()
+        has_more = len(changed) > limit
+        changed = changed[:limit]
+        
+        ids = [row['issue_id'] for row in changed]
+        rows = {}
+        if ids:
+            c.execute(
+                f'SELECT {issue_select_columns(fields, required=("id",))} FROM issue_reports '
+                f'WHERE id IN ({", ".join("?" * len(ids))})',
+                ids
+            )
+            rows = {row['id']: row for row in c.fetchall()}
         
         issues = []
-        for row in c.fetchall():
-            issues.append({
-                'id': row['id'],
-                'category': row['category'],
-                'latitude': row['latitude'],
-                'longitude': row['longitude'],
-                'address': row['address'],
-                'description': row['description'],
-                'status': row['status'],
-                'photoBase64': row['photo_base64'][:100] if row['photo_base64'] else None,  # First 100 chars
-                'createdAt': row['created_at'],
-                'updatedAt': row['updated_at']
-            })
+        deleted = []
+        for change in changed:
+            row = rows.get(change['issue_id'])
+            if row is None:
+                deleted.append({'id': change['issue_id'], 'version': change['version']})
+                continue
+            issue = issue_to_dict(row, fields)
+            issue['version'] = change['version']
+            issues.append(issue)
         
-        conn.close()
+        return jsonify({
+            'issues': issues,
+            'deleted': deleted,
+            'version': changed[-1]['version'] if changed else since,
+            'hasMore': has_more
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/stats', methods=['GET'])
+def get_issue_stats():
+    """Issue counts by status and category, read from the rollup table"""
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT category, status, count FROM issue_counts WHERE count > 0 ORDER BY category, status')
+        
+        by_status = defaultdict(int)
+        by_category = defaultdict(int)
+        breakdown = []
+        for row in c:
+            by_status[row['status']] += row['count']
+            by_category[row['category']] += row['count']
+            breakdown.append({'category': row['category'], 'status': row['status'], 'count': row['count']})
+        
+        return jsonify({
+            'total': sum(by_status.values()),
+            'byStatus': by_status,
+            'byCategory': by_category,
+            'byCategoryStatus': breakdown
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/heatmap', methods=['GET'])
+def get_issue_heatmap():
+    """
+    Report counts per geohash cell over a viewport (?bbox=, ?precision=),
+    optionally filtered by status and category. Reads only the rollup rows
+    of the cells in view, so the cost does not grow with the issue count.
+    """
+    try:
+        try:
+            min_lat, min_lng, max_lat, max_lng = parse_bbox(request.args.get('bbox') or '')
+            precision = int(request.args.get('precision') or HEATMAP_DEFAULT_PRECISION)
+            if not 1 <= precision <= HEATMAP_MAX_PRECISION:
+                raise ValueError(f'precision must be between 1 and {HEATMAP_MAX_PRECISION}')
+            cells = geohash_cells(min_lat, min_lng, max_lat, max_lng, precision)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        filters = ''
+        filter_params = []
+        if request.args.get('status'):
+            filters += ' AND status = ?'
+            filter_params.append(request.args.get('status'))
+        if request.args.get('category'):
+            filters += ' AND category = ?'
+            filter_params.append(request.args.get('category'))
+        
+        counts = []
+        hashes = list(cells)
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            c.execute(f'''
+                SELECT geohash, SUM(count) AS count FROM issue_geo_counts
+                WHERE precision = ? AND geohash IN ({', '.join('?' * len(chunk))}){filters}
+                GROUP BY geohash HAVING SUM(count) > 0
+            ''', [precision, *chunk, *filter_params])
+            counts.extend(c.fetchall())
+        
+        grid = [{
+            'geohash': row['geohash'],
+            'latitude': cells[row['geohash']][0],
+            'longitude': cells[row['geohash']][1],
+            'count': row['count']
+        } for row in counts]
+        grid.sort(key=lambda cell: cell['geohash'])
+        
+        return jsonify({
+            'precision': precision,
+            'cells': grid,
+            'total': sum(cell['count'] for cell in grid)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/clusters', methods=['GET'])
+def get_issue_clusters():
+    """
+    Get a page of near-duplicate clusters, most recently reported first.
+    Only clusters with at least ?minReports= reports (default 2) are listed;
+    their reports are available from /api/issues/list?clusterId=. total
+    counts every listed cluster, not just this page.
+    """
+    try:
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            min_reports = int(request.args.get('minReports') or 2)
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        filters = ' WHERE cl.report_count >= ?'
+        filter_params = [min_reports]
+        
+        if request.args.get('status'):
+            filters += ' AND r.status = ?'
+            filter_params.append(request.args.get('status'))
+        
+        if request.args.get('category'):
+            filters += ' AND cl.category = ?'
+            filter_params.append(request.args.get('category'))
+        
+        # The primary issue shares the cluster's id and carries its status
+        query = '''
+            SELECT cl.id, cl.category, cl.latitude, cl.longitude, cl.report_count,
+                   cl.first_reported_at, cl.last_reported_at, r.status
+            FROM issue_clusters cl JOIN issue_reports r ON r.id = cl.id
+        ''' + filters
+        params = list(filter_params)
+        
+        if after:
+            query += ' AND (cl.last_reported_at, cl.id) < (?, ?)'
+            params.extend(after)
+        
+        query += ' ORDER BY cl.last_reported_at DESC, cl.id DESC LIMIT ?'
+        params.append(limit + 1)
+        
+        c.execute(query, params)
+        rows = c.fetchall()
+        
+        next_cursor = encode_cursor(rows[limit - 1]['last_reported_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        clusters = [{
+            'id': row['id'],
+            'primaryIssueId': row['id'],
+            'category': row['category'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'status': row['status'],
+            'reportCount': row['report_count'],
+            'firstReportedAt': row['first_reported_at'],
+            'lastReportedAt': row['last_reported_at']
+        } for row in rows[:limit]]
+        
+        # Every cluster matching the filters, not just this page. CROSS JOIN
+        # keeps the few clusters past minReports as the outer loop instead of
+        # every issue with the status
+        c.execute(
+            'SELECT COUNT(*) FROM issue_clusters cl CROSS JOIN issue_reports r ON r.id = cl.id' + filters,
+            filter_params
+        )
+        total = c.fetchone()[0]
+        
+        return jsonify({
+            'clusters': clusters,
+            'total': total,
+            'nextCursor': next_cursor
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/stream', methods=['GET'])
+def stream_issue_changes():
+    """
+    Server-Sent Events feed of issue changes ('created', 'status', 'updated'
+    and 'deleted' events).
+    Reconnecting clients resume from the Last-Event-ID header or ?since=;
+    without either the feed starts at the current end of the log. Returns
+    503 with Retry-After once CHANGE_FEED_MAX_SUBSCRIBERS streams are open.
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        after_seq = int(since) if since else change_feed.last_seq
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an event id'}), 400
+    
+    if not change_feed.subscribe():
+        response = jsonify({'error': 'Too many open streams, retry shortly'})
+        response.headers['Retry-After'] = str(int(CHANGE_FEED_HEARTBEAT_SECONDS))
+        return response, 503
+    
+    def events(after_seq):
+        yield f'retry: {int(CHANGE_FEED_HEARTBEAT_SECONDS * 1000)}\n\n'
+        while True:
+            pending = change_feed.wait(after_seq, CHANGE_FEED_HEARTBEAT_SECONDS)
+            if pending is None:
+                end = change_feed.last_seq
+                conn = db_pool.acquire()
+                try:
+                    pending = change_feed.read(conn, after_seq)
+                finally:
+                    db_pool.release(conn)
+                if not pending:
+                    # Nothing left in the log up to what the poller has seen
+                    after_seq = max(after_seq, end)
+                    continue
+            if not pending:
+                yield ': keep-alive\n\n'
+                continue
+            for seq, frame in pending:
+                yield frame
+            after_seq = pending[-1][0]
+    
+    # Released when the server closes the response, even if the body was never started
+    response = Response(events(after_seq), mimetype='text/event-stream')
+    response.call_on_close(change_feed.unsubscribe)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/issues/stream/stats', methods=['GET'])
+def issue_stream_stats():
+    """Subscriber count and change-log position of the SSE feed"""
+    return jsonify(change_feed.stats()), 200
+
+@app.route('/api/issues/search', methods=['GET'])
+def search_issues():
+    """
+    Full-text search over issue descriptions and addresses, best BM25 match
+    first. Accepts the status/category filters and cursor/limit/fields of
+    the list endpoint; total counts every match, not just this page.
+    """
+    try:
+        try:
+            match = fts_query(request.args.get('q'))
+            fields = parse_issue_fields(request.args.get('fields'))
+            limit = parse_limit(request.args.get('limit'))
+            cursor = request.args.get('cursor')
+            after = decode_cursor(cursor, types=(float, int)) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        filters = ''
+        filter_params = []
+        
+        if request.args.get('status'):
+            filters += ' AND status = ?'
+            filter_params.append(request.args.get('status'))
+        
+        if request.args.get('category'):
+            filters += ' AND category = ?'
+            filter_params.append(request.args.get('category'))
+        
+        query = f'''
+            SELECT {issue_select_columns(fields, required=('id',))}, score FROM issue_reports
+            JOIN (
+                SELECT rowid AS fts_id, bm25(issue_reports_fts) AS score
+                FROM issue_reports_fts WHERE issue_reports_fts MATCH ?
+            ) ON fts_id = id
+            WHERE 1=1{filters}
+        '''
+        params = [match, *filter_params]
+        
+        if after:
+            query += ' AND (score, id) > (?, ?)'
+            params.extend(after)
+        
+        # bm25() is lower for better matches
+        query += ' ORDER BY score, id LIMIT ?'
+        params.append(limit + 1)
+        
+        c.execute(query, params)
+        rows = c.fetchall()
+        
+        next_cursor = encode_cursor(rows[limit - 1]['score'], rows[limit - 1]['id']) if len(rows) > limit else None
+        issues = []
+        for row in rows[:limit]:
+            issue = issue_to_dict(row, fields)
+            issue['relevance'] = round(-row['score'], 4)
+            issues.append(issue)
+        
+        # Every match, not just this page. CROSS JOIN keeps the matches as the
+        # outer loop; otherwise a status filter scans its index and runs the
+        # MATCH once per row
+        c.execute(f'''
+            SELECT COUNT(*) FROM (
+                SELECT rowid AS fts_id FROM issue_reports_fts WHERE issue_reports_fts MATCH ?
+            )
+            CROSS JOIN issue_reports ON id = fts_id
+            WHERE 1=1{filters}
+        ''', [match, *filter_params])
+        total = c.fetchone()[0]
         
         return jsonify({
             'issues': issues,
-            'total': len(issues)
+            'total': total,
+            'nextCursor': next_cursor
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/issues/nearby', methods=['GET'])
+def get_nearby_issues():
+    """
+    Issues within radiusM metres of lat/lng, or inside bbox=minLng,minLat,maxLng,maxLat,
+    nearest first. Candidates come from the R*Tree index and are then ranked by
+    haversine distance (from lat/lng, or the bbox centre). A bbox may be at
+    most as wide and as tall as the largest radius search; total counts
+    every issue found, not just the first limit.
+    """
+    try:
+        try:
+            fields = parse_issue_fields(request.args.get('fields'))
+            limit = parse_limit(request.args.get('limit'))
+            bbox_arg = request.args.get('bbox')
+            if bbox_arg:
+                min_lat, min_lng, max_lat, max_lng = parse_bbox(bbox_arg)
+                # Same area bound as radiusM, so a bbox cannot load the whole table
+                max_span_m = 2 * NEARBY_MAX_RADIUS_M
+                if max(bbox_span_m(min_lat, min_lng, max_lat, max_lng)) > max_span_m:
+                    raise ValueError(f'bbox must span at most {max_span_m} metres each way')
+                lat = parse_float_arg('lat', (min_lat + max_lat) / 2)
+                lng = parse_float_arg('lng', (min_lng + max_lng) / 2)
+                radius_m = None
+            else:
+                lat = parse_float_arg('lat')
+                lng = parse_float_arg('lng')
+                radius_m = parse_float_arg('radiusM', NEARBY_DEFAULT_RADIUS_M)
+                if not 0 < radius_m <= NEARBY_MAX_RADIUS_M:
+                    raise ValueError(f'radiusM must be between 0 and {NEARBY_MAX_RADIUS_M}')
+                min_lat, min_lng, max_lat, max_lng = radius_bbox(lat, lng, radius_m)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        columns = issue_select_columns(fields, required=('id', 'latitude', 'longitude'))
+        query = f'''
+            SELECT {columns} FROM issue_reports
+            WHERE id IN (
+                SELECT id FROM issue_reports_rtree
+                WHERE min_lat <= ? AND max_lat >= ? AND min_lng <= ? AND max_lng >= ?
+            )
+        '''
+        params = [max_lat, min_lat, max_lng, min_lng]
+        
+        if request.args.get('status'):
+            query += ' AND status = ?'
+            params.append(request.args.get('status'))
+        
+        if request.args.get('category'):
+            query += ' AND category = ?'
+            params.append(request.args.get('category'))
+        
+        c.execute(query, params)
+        
+        ranked = []
+        for row in c:
+            distance = haversine_m(lat, lng, row['latitude'], row['longitude'])
+            if radius_m is None or distance <= radius_m:
+                ranked.append((distance, row['id'], row))
+        
+        issues = []
+        for distance, _, row in heapq.nsmallest(limit, ranked, key=lambda r: (r[0], r[1])):
+            issue = issue_to_dict(row, fields)
+            issue['distanceM'] = round(distance, 1)
+            issues.append(issue)
+        
+        return jsonify({
+            'issues': issues,
+            'total': len(ranked)
         }), 200
     
     except Exception as e:
@@ -460,13 +3810,17 @@ def get_issue_details(issue_id):
     try:
         conn = get_db()
         c = conn.cursor()
-        c.execute('SELECT * FROM issue_reports WHERE id = ?', (issue_id,))
+        c.execute(f'SELECT {ISSUE_COLUMNS}, photo_base64 FROM issue_reports WHERE id = ?', (issue_id,))
         issue = c.fetchone()
-        conn.close()
         
         if not issue:
             return jsonify({'error': 'Issue report not found'}), 404
         
+        # Rows filed before the blob store keep their photo inline until migrated
+        photo_base64 = issue['photo_base64']
+        if issue['photo_sha256'] and blob_store.exists(issue['photo_sha256']):
+            photo_base64 = base64.b64encode(blob_store.read(issue['photo_sha256'])).decode()
+        
         return jsonify({
             'id': issue['id'],
             'category': issue['category'],
@@ -475,7 +3829,9 @@ def get_issue_details(issue_id):
             'address': issue['address'],
             'description': issue['description'],
             'status': issue['status'],
-            'photoBase64': issue['photo_base64'],
+            'photoBase64': photo_base64,
+            'photoSha256': issue['photo_sha256'],
+            'photoSize': issue['photo_size'],
             'createdAt': issue['created_at'],
             'updatedAt': issue['updated_at']
         }), 200
@@ -483,6 +3839,49 @@ def get_issue_details(issue_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/issues/<int:issue_id>/photo', methods=['GET'])
+def get_issue_photo(issue_id):
+    """Stream an issue photo, or its ?size=thumb|medium variant, with Range and ETag support"""
+    try:
+        size = request.args.get('size')
+        if size and size not in PHOTO_VARIANTS:
+            return jsonify({'error': f"size must be one of: {', '.join(PHOTO_VARIANTS)}"}), 400
+        
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT photo_sha256 FROM issue_reports WHERE id = ?', (issue_id,))
+        issue = c.fetchone()
+        
+        if not issue or not issue['photo_sha256'] or not blob_store.exists(issue['photo_sha256']):
+            return jsonify({'error': 'Photo not found'}), 404
+        
+        digest = issue['photo_sha256']
+        if size:
+            path = blob_store.variant_path(digest, size)
+            if not os.path.exists(path):
+                try:
+                    make_photo_variants(digest)
+                except OSError:
+                    return jsonify({'error': 'Photo could not be resized'}), 415
+            mime_type = 'image/jpeg'
+            etag = f"{digest}-{size}"
+        else:
+            path = blob_store.path_for(digest)
+            with open(path, 'rb') as f:
+                mime_type = sniff_image_type(f.read(12)) or 'application/octet-stream'
+            etag = digest
+        
+        return send_file(
+            path,
+            mimetype=mime_type,
+            etag=etag,
+            conditional=True,
+            max_age=PHOTO_CACHE_MAX_AGE
+        )
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/issues/<int:issue_id>/status', methods=['PUT'])
 def update_issue_status(issue_id):
     """Update status of an issue report"""
@@ -496,20 +3895,30 @@ def update_issue_status(issue_id):
         conn = get_db()
         c = conn.cursor()
         
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT category, status, latitude, longitude FROM issue_reports WHERE id = ?', (issue_id,))
+        old = c.fetchone()
+        
+        if not old:
+            conn.rollback()
+            return jsonify({'error': 'Issue not found'}), 404
+        
         c.execute('''
             UPDATE issue_reports 
             SET status = ?, updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (new_status, issue_id))
         
+        old_status = old['status'] or 'pending'
+        if new_status != old_status:
+            bump_issue_rollups(c, old['category'], old_status, old['latitude'], old['longitude'], -1)
+            bump_issue_rollups(c, old['category'], new_status, old['latitude'], old['longitude'], 1)
+        
         conn.commit()
+        change_feed.wake()
         
-        c.execute('SELECT * FROM issue_reports WHERE id = ?', (issue_id,))
+        c.execute('SELECT id, status, updated_at FROM issue_reports WHERE id = ?', (issue_id,))
         issue = c.fetchone()
-        conn.close()
-        
-        if not issue:
-            return jsonify({'error': 'Issue not found'}), 404
         
         return jsonify({
             'success': True,
@@ -528,6 +3937,62 @@ def update_issue_status(issue_id):
 
 # ==================== HEALTH & ROOT ====================
 
+def record_request_route():
+    req = request._get_current_object()
+    if req.url_rule is not None:
+        req.environ['cityconnect.route'] = req.url_rule.rule
+
+if METRICS_ENABLED or PROFILE_TOKEN or PROFILE_SAMPLE_RATE:
+    app.before_request(record_request_route)
+if PROFILE_TOKEN or PROFILE_SAMPLE_RATE:
+    app.wsgi_app = RequestProfiler(app.wsgi_app, PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_TOKEN)
+if METRICS_ENABLED:
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+if TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+def admit_request():
+    """
+    Refuse new work early: 503 once MAX_CONCURRENT_REQUESTS are in progress,
+    then 429 when the caller's bucket for this endpoint's budget is empty.
+    Callers with a valid bearer token are limited per user, others per IP.
+    """
+    if request.endpoint in ADMISSION_EXEMPT:
+        return None
+    if admission_slots is not None:
+        if not admission_slots.acquire(blocking=False):
+            metrics.add('cityconnect_requests_shed_total')
+            return server_busy_response()
+        g.admitted = True
+    if rate_limiter is not None:
+        budget = RATE_LIMIT_ROUTES.get(request.endpoint, 'default')
+        user = get_current_user()
+        identity = f"user:{user['user_id']}" if user else f'ip:{request.remote_addr}'
+        retry_after = rate_limiter.check(budget, identity)
+        if retry_after:
+            metrics.add('cityconnect_rate_limited_total', (budget,))
+            response = jsonify({'error': f'Too many requests, retry in {retry_after}s'})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+    return None
+
+def release_admission(exception=None):
+    if g.pop('admitted', False):
+        admission_slots.release()
+
+if rate_limiter is not None or admission_slots is not None:
+    app.before_request(admit_request)
+    app.teardown_request(release_admission)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Request and hot-path metrics in Prometheus text format: this worker's
+    live values plus the other workers' last flush when METRICS_DIR is set
+    """
+    others = [metrics.load(METRICS_DIR, exclude=metrics_file)] if metrics_file else []
+    return Response(metrics.render(others), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()}), 200
@@ -0,0 +1,198 @@
+"""
+Memory and fan-out latency of GET /api/issues/stream against subscriber count.
+
+    python benchmarks/bench_change_feed.py --subscribers 100 500 1000 2000
+
+Serves the app from a child process (threaded werkzeug server, with
+CHANGE_FEED_MAX_SUBSCRIBERS raised past the largest step) and opens idle SSE
+connections to it in steps. At each step it reports the server's
+resident memory and thread count, then changes an issue's status and
+times how long until every subscriber has received the event. Finally it
+reconnects with the Last-Event-ID from before the first step and checks
+that the stream replays every missed event without spinning on
+keep-alives, as it also checks for a resume from before the server
+started, when its buffer is still empty. Exits 1 if either fails.
+"""
+
+import argparse
+import json
+import multiprocessing
+import selectors
+import signal
+import socket
+import sys
+import time
+import urllib.request
+
+from common import load_app
+
+HOST = '127.0.0.1'
+
+
+def serve(port, db_path, ready, max_subscribers):
+    app_module = load_app(db_path, CHANGE_FEED_HEARTBEAT_SECONDS=60,
+                          CHANGE_FEED_MAX_SUBSCRIBERS=max_subscribers)
+    from werkzeug.serving import make_server
+    server = make_server(HOST, port, app_module.app, threaded=True)
+
+    def stop(signum, frame):
+        # Take the worker pool processes down with the server
+        app_module.shutdown_background_work()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    ready.set()
+    server.serve_forever()
+
+
+def server_memory(pid):
+    fields = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'Threads'):
+                fields[key] = value.split()[0]
+    return int(fields['VmRSS']) / 1024, int(fields['Threads'])
+
+
+def subscribe(port, last_event_id=None):
+    sock = socket.create_connection((HOST, port))
+    resume = f'Last-Event-ID: {last_event_id}\r\n' if last_event_id is not None else ''
+    sock.sendall(f'GET /api/issues/stream HTTP/1.1\r\nHost: {HOST}\r\n{resume}\r\n'.encode())
+    sock.setblocking(False)
+    return sock
+
+
+def resume(port, last_event_id, markers, seconds=1.0):
+    """Reconnect from last_event_id and count what the stream sends"""
+    sock = subscribe(port, last_event_id)
+    received = b''
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                received += sock.recv(65536)
+            except BlockingIOError:
+                time.sleep(0.01)
+    finally:
+        sock.close()
+    return {
+        'replayed': sum(marker in received for marker in markers),
+        'expected': len(markers),
+        'keep_alives': received.count(b': keep-alive'),
+    }
+
+
+def wait_for_event(selector, sockets, marker, timeout=30):
+    """Seconds until every socket has received bytes containing marker"""
+    started = time.perf_counter()
+    waiting = set(sockets)
+    buffers = {sock: b'' for sock in sockets}
+    while waiting and time.perf_counter() - started < timeout:
+        for key, _ in selector.select(timeout=1):
+            sock = key.fileobj
+            try:
+                chunk = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            buffers[sock] += chunk
+            if sock in waiting and marker in buffers[sock]:
+                waiting.discard(sock)
+                buffers[sock] = b''
+    return time.perf_counter() - started, len(waiting)
+
+
+def drain(selector, seconds=0.5):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                key.fileobj.recv(65536)
+            except BlockingIOError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--port', type=int, default=6099)
+    args = parser.parse_args()
+
+    app_module = load_app()  # creates the scratch database with one issue to update
+    conn = app_module.db_pool.connect()
+    conn.execute('''
+        INSERT INTO issue_reports (category, latitude, longitude, status)
+        VALUES ('road_damage', 3.14, 101.69, 'pending')
+    ''')
+    issue_id = conn.execute('SELECT MAX(id) FROM issue_reports').fetchone()[0]
+    conn.commit()
+    conn.close()
+
+    # A fresh interpreter, so the server has its own background threads
+    spawn = multiprocessing.get_context('spawn')
+    ready = spawn.Event()
+    # One slot past the largest step for the resume check
+    max_subscribers = max(args.subscribers) + 1
+    server = spawn.Process(target=serve, args=(args.port, app_module.DB_PATH, ready, max_subscribers))
+    server.start()
+    ready.wait(30)
+    time.sleep(0.5)
+
+    selector = selectors.DefaultSelector()
+    sockets = []
+    markers = []
+    rss_idle, threads_idle = server_memory(server.pid)
+    results = {'baseline': {'rss_mb': round(rss_idle, 1), 'threads': threads_idle}, 'steps': []}
+    try:
+        with urllib.request.urlopen(f'http://{HOST}:{args.port}/api/issues/stream/stats') as response:
+            start_seq = json.load(response)['lastSeq']
+        results['resume_after_restart'] = resume(args.port, 0, [f'id: {start_seq}\n'.encode()])
+        for index, target in enumerate(sorted(args.subscribers)):
+            while len(sockets) < target:
+                sock = subscribe(args.port)
+                selector.register(sock, selectors.EVENT_READ)
+                sockets.append(sock)
+            drain(selector, 1.0)
+            rss, threads = server_memory(server.pid)
+
+            status = f'bench_{index}'
+            markers.append(status.encode())
+            request = urllib.request.Request(
+                f'http://{HOST}:{args.port}/api/issues/{issue_id}/status',
+                data=json.dumps({'status': status}).encode(),
+                headers={'Content-Type': 'application/json'},
+                method='PUT'
+            )
+            urllib.request.urlopen(request).read()
+            fanout, missed = wait_for_event(selector, sockets, status.encode())
+
+            results['steps'].append({
+                'subscribers': len(sockets),
+                'rss_mb': round(rss, 1),
+                'rss_per_subscriber_kb': round((rss - rss_idle) * 1024 / len(sockets), 1),
+                'threads': threads,
+                'fanout_ms': round(fanout * 1000, 1),
+                'missed': missed,
+            })
+        for sock in sockets:
+            selector.unregister(sock)
+            sock.close()
+        sockets = []
+        results['resume'] = resume(args.port, start_seq, markers)
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.terminate()
+        server.join()
+
+    print(json.dumps(results, indent=2))
+    # One keep-alive per heartbeat at most; a resumed stream must not spin
+    passed = all(
+        check['replayed'] == check['expected'] and check['keep_alives'] <= 1
+        for check in (results['resume_after_restart'], results['resume'])
+    )
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
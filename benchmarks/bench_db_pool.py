@@ -0,0 +1,96 @@
+"""
+Compare per-request SQLite connections with the pooled WAL connection layer.
+
+    python benchmarks/bench_db_pool.py --concurrency 16 --requests 200
+
+Each worker mixes issue-list reads with issue creation so writers and
+readers contend the way they do in production. The per-request baseline
+connects the way the app did before the pool, with a bare
+sqlite3.connect() per request. Both runs share the database file, which
+init_db has put in WAL mode, so the comparison covers connection setup,
+pragmas and the statement cache, not the journal mode.
+"""
+
+import argparse
+import json
+import sqlite3
+
+from common import load_app, run_load
+
+PHOTO = 'data:image/jpeg;base64,' + 'A' * 4000
+
+
+def seed(client, count):
+    for i in range(count):
+        client.post('/api/issues/create', json={
+            'category': 'road_damage',
+            'photoBase64': PHOTO,
+            'latitude': 3.14 + i * 1e-4,
+            'longitude': 101.69,
+            'description': f'Seed issue {i}',
+        })
+
+
+class PerRequestConnections:
+    """Stands in for the pool with a fresh, unconfigured connection per checkout"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self, timeout=None):
+        return self.connect()
+
+    def release(self, conn):
+        conn.close()
+
+    def close(self):
+        pass
+
+
+def run(app_module, db_pool, args):
+    app_module.db_pool.close()
+    app_module.db_pool = db_pool
+    client = app_module.app.test_client()
+
+    def call(worker, i):
+        if i % args.write_every == 0:
+            response = client.post('/api/issues/create', json={
+                'category': 'waste_management',
+                'photoBase64': PHOTO,
+                'latitude': 3.15,
+                'longitude': 101.7,
+                'description': f'Bench {worker}-{i}',
+            })
+            return response.status_code == 201
+        response = client.get('/api/issues/list?status=pending')
+        return response.status_code == 200
+
+    return run_load(call, args.concurrency, args.requests)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per worker')
+    parser.add_argument('--seed', type=int, default=500, help='issues inserted before the run')
+    parser.add_argument('--write-every', type=int, default=10, help='one create per N requests')
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    seed(app_module.app.test_client(), args.seed)
+
+    results = {
+        'per_request': run(app_module, PerRequestConnections(app_module.DB_PATH), args),
+        'pooled': run(app_module, app_module.ConnectionPool(app_module.DB_PATH, args.pool_size), args),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
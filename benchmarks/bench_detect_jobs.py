@@ -0,0 +1,82 @@
+"""
+Offline load test of heritage detection with the stub vision client.
+
+    python benchmarks/bench_detect_jobs.py --latency 0.5 --concurrency 32
+
+Runs detection traffic synchronously and then through the async job queue,
+while a second group of workers hits /health, and reports how the queue
+protects other routes (health latency) and how often it pushes back (429).
+"""
+
+import argparse
+import base64
+import json
+import os
+import threading
+import time
+
+from common import load_app, run_load, summarize
+
+
+def random_image():
+    # Undecodable bytes skip the perceptual-hash cache, so every call reaches the stub
+    return base64.b64encode(os.urandom(2048)).decode()
+
+
+def run(client, args, async_mode):
+    statuses = {}
+    lock = threading.Lock()
+    health_latencies = []
+    stop = threading.Event()
+
+    def detect(worker, i):
+        url = '/api/heritage/detect?async=1' if async_mode else '/api/heritage/detect'
+        response = client.post(url, json={'imageBase64': random_image()})
+        with lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return response.status_code in (200, 202, 429)
+
+    def health():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            client.get('/health')
+            health_latencies.append(time.perf_counter() - t0)
+            time.sleep(0.01)
+
+    probe = threading.Thread(target=health)
+    probe.start()
+    started = time.perf_counter()
+    detect_summary = run_load(detect, args.concurrency, args.requests)
+    stop.set()
+    probe.join()
+    return {
+        'detect': detect_summary,
+        'status_codes': statuses,
+        'health': summarize(health_latencies, time.perf_counter() - started),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.5, help='stub model latency (s)')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=5, help='requests per worker')
+    parser.add_argument('--workers', type=int, default=4, help='DETECT_WORKERS')
+    parser.add_argument('--queue-size', type=int, default=64, help='DETECT_QUEUE_SIZE')
+    args = parser.parse_args()
+
+    app_module = load_app(
+        VISION_CLIENT='stub',
+        STUB_VISION_LATENCY=args.latency,
+        DETECT_WORKERS=args.workers,
+        DETECT_QUEUE_SIZE=args.queue_size,
+    )
+    client = app_module.app.test_client()
+    print(json.dumps({
+        'sync': run(client, args, async_mode=False),
+        'async': run(client, args, async_mode=True),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Image normalization throughput per core, inline versus the image worker pool.
+
+    python benchmarks/bench_image_pipeline.py --workers 1 2 4 --megapixels 12
+
+Builds a camera-sized JPEG (with an EXIF orientation tag), then for each
+worker count normalizes it from twice as many client threads through
+image_workers, as create_issue does. Reports images per second overall and
+per worker, latency, and how much smaller the stored photo and the image
+sent to the vision model are than the upload.
+"""
+
+import argparse
+import io
+import json
+import os
+
+from PIL import Image
+
+from common import load_app, run_load
+
+
+def camera_jpeg(megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    img = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    img = Image.blend(img, noise, 0.3)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees, as phones often write
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--requests', type=int, default=10, help='images per client thread')
+    parser.add_argument('--format', choices=['jpeg', 'webp'], default='jpeg', help='IMAGE_FORMAT')
+    args = parser.parse_args()
+
+    app_module = load_app(IMAGE_WORKERS=0, IMAGE_FORMAT=args.format)
+    photo = camera_jpeg(args.megapixels)
+    stored = app_module.normalize_image(photo, app_module.PHOTO_MAX_DIMENSION, app_module.PHOTO_VARIANTS)
+    detect = app_module.normalize_image(photo, app_module.DETECT_MAX_DIMENSION)
+
+    results = {
+        'cores': os.cpu_count(),
+        'upload_bytes': len(photo),
+        'stored_bytes': len(stored['data']),
+        'variant_bytes': {name: len(data) for name, data in stored['variants'].items()},
+        'vision_bytes': len(detect['data']),
+    }
+    for workers in [0] + args.workers:
+        app_module.image_workers.shutdown()
+        app_module.image_workers = app_module.WorkerPool(workers, 4 * max(workers, 1))
+
+        def normalize(worker, i):
+            result = app_module.image_workers.run(
+                app_module.normalize_image, photo, app_module.PHOTO_MAX_DIMENSION, app_module.PHOTO_VARIANTS
+            )
+            return bool(result['data'])
+
+        summary = run_load(normalize, max(2, 2 * workers), args.requests)
+        summary['images_per_worker_s'] = round(summary['rps'] / max(workers, 1), 2)
+        results['inline' if workers == 0 else f'pool_{workers}'] = summary
+
+    app_module.image_workers.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Cost of the metrics instrumentation per observation and per request.
+
+    python benchmarks/bench_metrics.py --iterations 200000 --threads 8
+
+Times Metrics.add and Metrics.observe from one thread and from --threads
+threads at once, then the metrics middleware around a minimal WSGI app
+against that app alone, plus the route hook, which together are the
+per-request overhead. Finally renders /metrics to time a scrape.
+"""
+
+import argparse
+import json
+import threading
+import time
+
+from common import load_app
+
+
+def per_call_ns(fn, iterations, threads):
+    gate = threading.Barrier(threads + 1)
+
+    def worker():
+        gate.wait()
+        for i in range(iterations):
+            fn(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    gate.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return round((time.perf_counter() - started) / (iterations * threads) * 1e9, 1)
+
+
+def hello_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+    return [b'ok']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    app_module = load_app(METRICS_ENABLED=1, VISION_CLIENT='stub')
+    metrics = app_module.metrics
+    labels = ('GET', '/api/issues/list')
+
+    def add(i):
+        metrics.add('cityconnect_http_requests_total', labels + (200,))
+
+    def observe(i):
+        metrics.observe('cityconnect_http_request_duration_seconds', (i % 1000) / 10000, labels)
+
+    results = {
+        'add_ns': per_call_ns(add, args.iterations, 1),
+        'observe_ns': per_call_ns(observe, args.iterations, 1),
+        f'observe_ns_{args.threads}_threads': per_call_ns(observe, args.iterations // args.threads, args.threads),
+    }
+
+    environ = {'REQUEST_METHOD': 'GET', 'cityconnect.route': '/health'}
+    wrapped = app_module.MetricsMiddleware(hello_app)
+    start_response = lambda status, headers, exc_info=None: None
+    bare_ns = per_call_ns(lambda i: hello_app(environ, start_response), args.iterations, 1)
+    wrapped_ns = per_call_ns(lambda i: wrapped(environ, start_response), args.iterations, 1)
+    with app_module.app.test_request_context('/health'):
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            app_module.record_request_route()
+        hook_ns = round((time.perf_counter() - started) / args.iterations * 1e9, 1)
+    results['middleware_ns'] = round(wrapped_ns - bare_ns, 1)
+    results['route_hook_ns'] = hook_ns
+    results['overhead_us_per_request'] = round((wrapped_ns - bare_ns + hook_ns) / 1000, 2)
+
+    started = time.perf_counter()
+    body = metrics.render()
+    results['scrape_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    results['scrape_bytes'] = len(body)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
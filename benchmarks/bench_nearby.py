@@ -0,0 +1,82 @@
+"""
+Latency of GET /api/issues/nearby against a large synthetic city.
+
+    python benchmarks/bench_nearby.py --issues 1000000 --radius 500
+
+Issues are bulk-inserted straight into SQLite (the R*Tree triggers keep the
+spatial index in sync) around Kuala Lumpur, then random radius and bbox
+queries are timed through the Flask test client.
+"""
+
+import argparse
+import json
+import random
+import sqlite3
+
+from common import load_app, run_load
+
+CENTER_LAT, CENTER_LNG = 3.1390, 101.6869
+SPREAD_DEG = 0.25  # roughly a 55 km square
+
+
+def seed(db_path, count, batch=50000):
+    conn = sqlite3.connect(db_path)
+    rng = random.Random(42)
+    for start in range(0, count, batch):
+        rows = [
+            (
+                rng.choice(['road_damage', 'waste_management', 'street_lighting']),
+                CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                CENTER_LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                f'Synthetic issue {start + i}',
+            )
+            for i in range(min(batch, count - start))
+        ]
+        conn.executemany(
+            'INSERT INTO issue_reports (category, latitude, longitude, description) VALUES (?, ?, ?, ?)',
+            rows
+        )
+        conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--issues', type=int, default=100000)
+    parser.add_argument('--radius', type=float, default=500, help='query radius in metres')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=500, help='requests per worker')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    seed(app_module.DB_PATH, args.issues)
+    client = app_module.app.test_client()
+    rng = random.Random(7)
+
+    def radius_query(worker, i):
+        response = client.get('/api/issues/nearby', query_string={
+            'lat': CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+            'lng': CENTER_LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+            'radiusM': args.radius,
+            'limit': 50,
+        })
+        return response.status_code == 200
+
+    def bbox_query(worker, i):
+        lat = CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        lng = CENTER_LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+        response = client.get('/api/issues/nearby', query_string={
+            'bbox': f'{lng - 0.005},{lat - 0.005},{lng + 0.005},{lat + 0.005}',
+            'limit': 50,
+        })
+        return response.status_code == 200
+
+    print(json.dumps({
+        'issues': args.issues,
+        'radius': run_load(radius_query, args.concurrency, args.requests),
+        'bbox': run_load(bbox_query, args.concurrency, args.requests),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
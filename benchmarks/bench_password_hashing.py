@@ -0,0 +1,54 @@
+"""
+Logins per second with inline hashing versus the hashing process pool.
+
+    python benchmarks/bench_password_hashing.py --workers 1 2 4 8
+
+For each worker count, drives POST /api/auth/login from twice as many
+client threads (so every worker stays busy) and reports throughput,
+latency and how many requests were shed with 503.
+"""
+
+import argparse
+import json
+import os
+
+from common import load_app, run_load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument('--requests', type=int, default=20, help='requests per client thread')
+    parser.add_argument('--queue', type=int, default=64, help='PASSWORD_HASH_QUEUE')
+    args = parser.parse_args()
+
+    app_module = load_app(PASSWORD_HASH_WORKERS=0)
+    client = app_module.app.test_client()
+    client.post('/api/auth/signup', json={'email': 'bench@example.com', 'password': 'bench-password'})
+
+    results = {'cores': os.cpu_count()}
+    for workers in [0] + args.workers:
+        app_module.password_hasher.shutdown()
+        app_module.password_hasher = app_module.PasswordHasher(workers, args.queue)
+        shed = [0]
+
+        def login(worker, i):
+            response = client.post('/api/auth/login', json={
+                'email': 'bench@example.com',
+                'password': 'bench-password',
+            })
+            if response.status_code == 503:
+                shed[0] += 1
+            return response.status_code == 200
+
+        concurrency = max(2, 2 * workers)
+        summary = run_load(login, concurrency, args.requests)
+        summary['shed_503'] = shed[0]
+        results['inline' if workers == 0 else f'pool_{workers}'] = summary
+
+    app_module.password_hasher.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
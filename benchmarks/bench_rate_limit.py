@@ -0,0 +1,83 @@
+"""
+Rate limiter cost per check, and whether worker processes share a budget.
+
+    python benchmarks/bench_rate_limit.py --processes 4 --capacity 100
+
+Times RateLimiter.check against the memory and SQLite bucket stores, for
+one hot key and for many distinct keys. Then --processes processes each
+make --attempts checks against a single budget of --capacity tokens at
+once, as gunicorn workers would, and the number let through is compared
+with the budget: the SQLite store should admit the budget once in total,
+the memory store once per process.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from common import load_app
+
+
+def per_check_us(limiter, keys, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        limiter.check('default', keys[i % len(keys)])
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+def draw(store_kind, path, capacity, attempts, start, allowed):
+    app_module = load_app()
+    store = app_module.SQLiteBucketStore(path) if store_kind == 'sqlite' else app_module.MemoryBucketStore()
+    limiter = app_module.RateLimiter(store, {'shared': f'{capacity}/3600'})
+    start.wait()
+    got = sum(1 for _ in range(attempts) if limiter.check('shared', 'ip:203.0.113.7') == 0)
+    with allowed.get_lock():
+        allowed.value += got
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--capacity', type=int, default=100)
+    parser.add_argument('--attempts', type=int, default=1000, help='checks per process')
+    args = parser.parse_args()
+
+    app_module = load_app()
+    workdir = tempfile.mkdtemp(prefix='cityconne-ratelimit-')
+    stores = {
+        'memory': app_module.MemoryBucketStore(),
+        'sqlite': app_module.SQLiteBucketStore(os.path.join(workdir, 'cost.db')),
+    }
+    results = {}
+    for kind, store in stores.items():
+        limiter = app_module.RateLimiter(store, {'default': '1000000/1'})
+        results[kind] = {
+            'hot_key_us': per_check_us(limiter, ['user:1'], args.iterations),
+            'distinct_keys_us': per_check_us(limiter, [f'ip:10.0.{i // 256}.{i % 256}' for i in range(10000)], args.iterations),
+        }
+
+    fork = multiprocessing.get_context('fork')
+    for kind in stores:
+        path = os.path.join(workdir, f'shared-{kind}.db')
+        start, allowed = fork.Event(), fork.Value('i', 0)
+        workers = [
+            fork.Process(target=draw, args=(kind, path, args.capacity, args.attempts, start, allowed))
+            for _ in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.5)
+        start.set()
+        for worker in workers:
+            worker.join()
+        results[kind].update({'processes': args.processes, 'budget': args.capacity, 'allowed': allowed.value})
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Mixed-traffic load test of the production server (gunicorn, gthread workers).
+
+    python benchmarks/bench_serving.py --detect-clients 64 --clients 16 --duration 20
+
+Starts gunicorn with gunicorn.conf.py against a scratch database and the
+stub vision client, then for --duration seconds runs slow detection
+clients alongside clients that log in and page through the issue list,
+each over its own keep-alive connection. Reports latency and status codes
+per route, and how long the server takes to stop gracefully. Pass a
+--detect-max-inflight above --threads to see slow detections hold every
+thread and stall the other routes.
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+
+from common import start_server, summarize
+
+HOST = '127.0.0.1'
+
+
+def request(conn, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--detect-clients', type=int, default=64)
+    parser.add_argument('--clients', type=int, default=16, help='login + list clients')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--latency', type=float, default=2.0, help='stub model latency (s)')
+    parser.add_argument('--workers', type=int, default=2, help='WEB_CONCURRENCY')
+    parser.add_argument('--threads', type=int, default=32, help='WEB_THREADS')
+    parser.add_argument('--detect-max-inflight', type=int, default=16, help='DETECT_MAX_INFLIGHT')
+    parser.add_argument('--port', type=int, default=6098)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='cityconne-serve-')
+    server = start_server(
+        args.port,
+        HOST,
+        DB_PATH=os.path.join(workdir, 'bench.db'),
+        PHOTO_STORE_DIR=os.path.join(workdir, 'photo_store'),
+        VISION_CLIENT='stub',
+        STUB_VISION_LATENCY=args.latency,
+        WEB_CONCURRENCY=args.workers,
+        WEB_THREADS=args.threads,
+        DETECT_MAX_INFLIGHT=args.detect_max_inflight,
+    )
+    conn = http.client.HTTPConnection(HOST, args.port)
+    account = {'email': 'bench@example.com', 'password': 'bench-password', 'username': 'bench'}
+    request(conn, 'POST', '/api/auth/signup', account)
+
+    latencies = {'detect': [], 'login': [], 'list': []}
+    statuses = {route: {} for route in latencies}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def record(route, started, status):
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[route].append(elapsed)
+            statuses[route][status] = statuses[route].get(status, 0) + 1
+
+    def detect_client():
+        conn = http.client.HTTPConnection(HOST, args.port, timeout=60)
+        while not stop.is_set():
+            # Undecodable bytes skip the perceptual-hash cache and coalescing
+            image = base64.b64encode(os.urandom(2048)).decode()
+            started = time.perf_counter()
+            status, _ = request(conn, 'POST', '/api/heritage/detect', {'imageBase64': image})
+            record('detect', started, status)
+            if status == 503:
+                time.sleep(0.5)
+
+    def user_client():
+        conn = http.client.HTTPConnection(HOST, args.port, timeout=60)
+        while not stop.is_set():
+            started = time.perf_counter()
+            status, body = request(conn, 'POST', '/api/auth/login', account)
+            record('login', started, status)
+            token = json.loads(body).get('token') if status == 200 else None
+            headers = {'Authorization': f'Bearer {token}'} if token else {}
+            for _ in range(5):
+                started = time.perf_counter()
+                status, _ = request(conn, 'GET', '/api/issues/list?limit=50', headers=headers)
+                record('list', started, status)
+
+    threads = [threading.Thread(target=detect_client, daemon=True) for _ in range(args.detect_clients)]
+    threads += [threading.Thread(target=user_client, daemon=True) for _ in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.latency + 30)
+    elapsed = time.perf_counter() - started
+
+    stopping = time.perf_counter()
+    server.send_signal(signal.SIGTERM)
+    server.wait(timeout=120)
+
+    results = {'config': vars(args)}
+    for route, samples in latencies.items():
+        results[route] = summarize(samples, elapsed)
+        results[route]['status_codes'] = statuses[route]
+    results['graceful_shutdown_s'] = round(time.perf_counter() - stopping, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Concurrency check for coalescing identical in-flight detection requests.
+
+    python benchmarks/bench_singleflight.py --concurrency 20 --latency 0.5
+
+Fires `concurrency` identical /api/heritage/detect requests at once against
+a slow stub vision client and checks that they shared one upstream call
+and got the same answer. Then does the same with a failing stub to check
+the error reaches every waiter.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+
+from common import load_app
+
+
+class FailingVisionClient:
+    def __init__(self, stub):
+        self.stub = stub
+        self.messages = self
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await self.stub.create(**kwargs)
+        raise RuntimeError('upstream unavailable')
+
+
+def burst(client, concurrency, image):
+    responses = [None] * concurrency
+    gate = threading.Barrier(concurrency)
+
+    def fire(n):
+        gate.wait()
+        response = client.post('/api/heritage/detect', json={'imageBase64': image})
+        responses[n] = (response.status_code, response.get_json())
+
+    threads = [threading.Thread(target=fire, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.5, help='stub model latency (s)')
+    args = parser.parse_args()
+
+    # Every request of a burst must get a detection slot to be coalesced
+    app_module = load_app(VISION_CLIENT='stub', STUB_VISION_LATENCY=args.latency,
+                          DETECT_MAX_INFLIGHT=args.concurrency)
+    client = app_module.app.test_client()
+
+    # Undecodable bytes bypass the perceptual-hash cache, isolating coalescing
+    ok = burst(client, args.concurrency, base64.b64encode(os.urandom(2048)).decode())
+    after_ok = app_module.detection_flight.stats()
+
+    app_module.client = FailingVisionClient(app_module.client)
+    failed = burst(client, args.concurrency, base64.b64encode(os.urandom(2048)).decode())
+
+    report = {
+        'success_burst': {
+            'status_codes': sorted({code for code, _ in ok}),
+            'identical_bodies': len({json.dumps(body, sort_keys=True) for _, body in ok}) == 1,
+            'upstream_calls': after_ok['upstreamCalls'],
+            'coalesced': after_ok['coalesced'],
+        },
+        'error_burst': {
+            'status_codes': sorted({code for code, _ in failed}),
+            'errors': sorted({body.get('error') for _, body in failed}),
+            'upstream_calls': app_module.client.calls,
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+    passed = (
+        report['success_burst']['upstream_calls'] == 1
+        and report['success_burst']['identical_bodies']
+        and report['error_burst']['upstream_calls'] == 1
+        and report['error_burst']['status_codes'] == [500]
+    )
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
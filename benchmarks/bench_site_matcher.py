@@ -0,0 +1,78 @@
+"""
+Build time and lookup latency of the heritage site name index.
+
+    python benchmarks/bench_site_matcher.py --sites 50000
+
+Generates a synthetic multi-city catalogue, then times matching perturbed
+names (abbreviations, dropped words, typos) against it.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from common import load_app, percentile
+
+PREFIXES = ['Masjid', 'Istana', 'Kuil', 'Gereja', 'Rumah', 'Kota', 'Bangunan', 'Muzium', 'Stesen', 'Jambatan']
+WORDS = ['Sultan', 'Abdul', 'Samad', 'Jamek', 'Negara', 'Merdeka', 'Lama', 'Besar', 'Diraja', 'Warisan',
+         'Kapitan', 'Keling', 'Cheng', 'Hoon', 'Teng', 'Sri', 'Mahamariamman', 'Kristus', 'Santa', 'Maria']
+CITIES = ['Kuala Lumpur', 'Melaka', 'George Town', 'Ipoh', 'Kuching', 'Kota Bharu', 'Johor Bahru', 'Seremban']
+
+
+def synthetic_sites(count, rng):
+    return [
+        {
+            'id': i,
+            'name': f"{rng.choice(PREFIXES)} {' '.join(rng.sample(WORDS, 2))} {rng.choice(CITIES)} {i}",
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+def perturb(name, rng):
+    words = name.split()
+    if len(words) > 3 and rng.random() < 0.5:
+        words.pop(rng.randrange(1, len(words) - 1))
+    word = rng.randrange(len(words))
+    if len(words[word]) > 4 and rng.random() < 0.5:
+        chars = list(words[word])
+        chars[rng.randrange(1, len(chars) - 1)] = rng.choice('aeiou')
+        words[word] = ''.join(chars)
+    return ' '.join(words).lower()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sites', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    rng = random.Random(3)
+    sites = synthetic_sites(args.sites, rng)
+
+    t0 = time.perf_counter()
+    index = app_module.SiteNameIndex(sites)
+    build_s = time.perf_counter() - t0
+
+    latencies, correct = [], 0
+    for _ in range(args.queries):
+        site = rng.choice(sites)
+        query = perturb(site['name'], rng)
+        t0 = time.perf_counter()
+        match, _ = index.match(query, app_module.SITE_MATCH_MIN_SCORE)
+        latencies.append(time.perf_counter() - t0)
+        correct += bool(match) and match['id'] == site['id']
+
+    print(json.dumps({
+        'sites': args.sites,
+        'build_s': round(build_s, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'accuracy': round(correct / args.queries, 4),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
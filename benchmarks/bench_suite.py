@@ -0,0 +1,517 @@
+"""
+Reproducible end-to-end benchmark of every backend route, with a compare mode.
+
+    python benchmarks/bench_suite.py run --issues 100000 --db /tmp/city.db --out before.json
+    python benchmarks/bench_suite.py run --issues 100000 --db /tmp/city.db --out after.json
+    python benchmarks/bench_suite.py compare before.json after.json --threshold 0.15
+
+run seeds a template database (--db, on first use only) with synthetic
+users and --issues issues spread over Kuala Lumpur, a --photo-fraction of
+them carrying one of --photos camera-sized photos stored as the upload path
+stores them. Each run serves a fresh copy of the template from gunicorn
+with the stub vision client (--vision-latency seconds per call), then
+drives each route in turn from --concurrency keep-alive clients sending
+--requests requests each. All randomness is seeded, so two runs send the
+same requests. Throughput, p50/p95/p99 and status codes per route, and the
+server's peak RSS, are written to --out (and stdout) as JSON.
+
+compare flags each route whose p50, p95 or p99 grew, or whose throughput
+fell, by more than --threshold (and by at least --min-ms for latencies),
+and exits with status 1 when any did.
+"""
+
+import argparse
+import base64
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from PIL import Image
+
+from common import ROOT, load_app, start_server, summarize
+
+HOST = '127.0.0.1'
+CENTER_LAT, CENTER_LNG = 3.1390, 101.6869
+SPREAD_DEG = 0.25  # roughly a 55 km square
+CATEGORIES = ['road_damage', 'waste_management', 'street_lighting', 'drainage', 'vandalism']
+STATUSES = ['pending', 'pending', 'pending', 'in_progress', 'resolved']
+WORDS = (
+    'pothole crack flooded drain blocked streetlight broken rubbish overflowing bin '
+    'graffiti wall fallen tree signboard missing manhole cover leaking pipe '
+    'sidewalk uneven traffic light faulty illegal dumping near school market bus stop'
+).split()
+STREETS = ['Jalan Tun Razak', 'Jalan Ampang', 'Jalan Bukit Bintang', 'Jalan Sultan Ismail', 'Jalan Pudu']
+PASSWORD = 'bench-password'
+
+
+# ---------------------------------------------------------------- seeding
+
+def camera_photo(rng, width=2048, height=1536):
+    """A noisy JPEG, so it compresses about as well as a phone photo"""
+    img = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.frombytes('L', (width, height), rng.randbytes(width * height)).convert('RGB')
+    img = Image.blend(img, noise, 0.05 + rng.random() * 0.04)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def description(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+
+
+def seed(app_module, args):
+    """Fill the template database; returns how long it took (s)"""
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    conn = sqlite3.connect(app_module.DB_PATH)
+    c = conn.cursor()
+
+    password_hash = app_module.hash_password(PASSWORD)
+    c.executemany(
+        'INSERT INTO users (email, password_hash, username) VALUES (?, ?, ?)',
+        [(f'bench{i}@example.com', password_hash, f'bench{i}') for i in range(args.users)]
+    )
+    user_ids = [row[0] for row in c.execute('SELECT id FROM users ORDER BY id')]
+
+    photos = []
+    for _ in range(args.photos):
+        processed = app_module.normalize_image(
+            camera_photo(rng), app_module.PHOTO_MAX_DIMENSION, app_module.PHOTO_VARIANTS
+        )
+        digest, size = app_module.blob_store.put(processed['data'])
+        for name, data in processed['variants'].items():
+            app_module.blob_store.write(app_module.blob_store.variant_path(digest, name), data)
+        photos.append((digest, size, f"{processed['dhash']:016x}"))
+
+    first_id = (c.execute('SELECT MAX(id) FROM issue_reports').fetchone()[0] or 0) + 1
+    now = datetime(2026, 1, 1)
+    batch = 50000
+    for start in range(0, args.issues, batch):
+        rows = []
+        for i in range(start, min(start + batch, args.issues)):
+            photo = rng.choice(photos) if rng.random() < args.photo_fraction else (None, None, None)
+            created_at = (now - timedelta(seconds=rng.randint(0, 90 * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+            rows.append((
+                first_id + i, rng.choice(user_ids), rng.choice(CATEGORIES), *photo,
+                CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                CENTER_LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                f'{rng.randint(1, 300)} {rng.choice(STREETS)}', description(rng),
+                rng.choice(STATUSES), first_id + i, created_at, created_at,
+            ))
+        c.executemany('''
+            INSERT INTO issue_reports (id, user_id, category, photo_sha256, photo_size, photo_dhash,
+                latitude, longitude, address, description, status, cluster_id, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.commit()
+
+    c.execute('''
+        INSERT INTO issue_clusters (id, category, latitude, longitude, first_reported_at, last_reported_at)
+        SELECT id, category, latitude, longitude, created_at, created_at FROM issue_reports WHERE id >= ?
+    ''', (first_id,))
+    app_module.rebuild_issue_rollups(c)
+    conn.commit()
+    c.execute('ANALYZE')
+    conn.close()
+    return time.perf_counter() - started
+
+
+def copy_database(src, dst):
+    """Consistent copy of a WAL database"""
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    source.backup(target)
+    target.close()
+    source.close()
+
+
+# ---------------------------------------------------------------- scenarios
+
+def small_image(rng):
+    """A distinct little JPEG, so each detection misses the near-duplicate cache"""
+    img = Image.frombytes('RGB', (64, 64), rng.randbytes(64 * 64 * 3))
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=85)
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def random_point(rng):
+    return CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER_LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+
+
+def random_bbox(rng, half_deg):
+    lat, lng = random_point(rng)
+    return f'{lng - half_deg},{lat - half_deg},{lng + half_deg},{lat + half_deg}'
+
+
+def issue_report(ctx, rng):
+    lat, lng = random_point(rng)
+    return {
+        'category': rng.choice(CATEGORIES),
+        'photoBase64': ctx['upload_photo'],
+        'latitude': lat,
+        'longitude': lng,
+        'address': f'{rng.randint(1, 300)} {rng.choice(STREETS)}',
+        'description': description(rng),
+    }
+
+
+def scenarios():
+    """
+    (name, route rule, build) in the order they run; build(ctx, rng, worker, i)
+    returns (method, path, JSON body or None, headers). Reads come before the
+    writes that would change them, and logout last but one since it revokes.
+    """
+    auth = lambda ctx: {'Authorization': f"Bearer {ctx['token']}"}
+    return [
+        ('health', '/health', lambda ctx, rng, w, i: ('GET', '/health', None, {})),
+        ('root', '/', lambda ctx, rng, w, i: ('GET', '/', None, {})),
+        ('heritage_list', '/api/heritage/list',
+         lambda ctx, rng, w, i: ('GET', '/api/heritage/list', None, {})),
+        ('heritage_details', '/api/heritage/<int:site_id>',
+         lambda ctx, rng, w, i: ('GET', f"/api/heritage/{rng.choice(ctx['site_ids'])}", None, {})),
+        ('login', '/api/auth/login',
+         lambda ctx, rng, w, i: ('POST', '/api/auth/login',
+                                 {'email': f"bench{rng.randrange(ctx['users'])}@example.com", 'password': PASSWORD}, {})),
+        ('signup', '/api/auth/signup',
+         lambda ctx, rng, w, i: ('POST', '/api/auth/signup',
+                                 {'email': f'suite-{w}-{i}@example.com', 'password': PASSWORD, 'username': f'suite-{w}-{i}'}, {})),
+        ('auth_stats', '/api/auth/stats', lambda ctx, rng, w, i: ('GET', '/api/auth/stats', None, {})),
+        ('issues_list', '/api/issues/list',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/list?limit=50&status={rng.choice(STATUSES)}", None, auth(ctx))),
+        ('issues_list_cluster', '/api/issues/list',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/list?limit=50&clusterId={rng.randint(*ctx['issue_ids'])}", None, {})),
+        ('issue_details', '/api/issues/<int:issue_id>',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/{rng.randint(*ctx['issue_ids'])}", None, {})),
+        ('issue_photo', '/api/issues/<int:issue_id>/photo',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/{rng.choice(ctx['photo_issue_ids'])}/photo?size=thumb", None, {})),
+        ('issues_nearby', '/api/issues/nearby',
+         lambda ctx, rng, w, i: ('GET', '/api/issues/nearby?lat={}&lng={}&radiusM=500&limit=50'.format(*random_point(rng)), None, {})),
+        ('issues_search', '/api/issues/search',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/search?q={rng.choice(WORDS)}+{rng.choice(WORDS)}&limit=20", None, {})),
+        ('issues_changes', '/api/issues/changes',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/changes?since={rng.randint(0, ctx['last_seq'])}&limit=100", None, {})),
+        ('issues_stats', '/api/issues/stats', lambda ctx, rng, w, i: ('GET', '/api/issues/stats', None, {})),
+        ('issues_heatmap', '/api/issues/heatmap',
+         lambda ctx, rng, w, i: ('GET', f'/api/issues/heatmap?bbox={random_bbox(rng, 0.05)}&precision=6', None, {})),
+        ('issues_clusters', '/api/issues/clusters',
+         lambda ctx, rng, w, i: ('GET', '/api/issues/clusters?minReports=1&limit=50', None, {})),
+        ('detect', '/api/heritage/detect',
+         lambda ctx, rng, w, i: ('POST', '/api/heritage/detect', {'imageBase64': small_image(rng)}, {})),
+        ('detect_async', '/api/heritage/detect',
+         lambda ctx, rng, w, i: ('POST', '/api/heritage/detect?async=1', {'imageBase64': small_image(rng)}, {})),
+        ('detect_job', '/api/heritage/detect/jobs/<job_id>',
+         lambda ctx, rng, w, i: ('GET', f"/api/heritage/detect/jobs/{rng.choice(ctx['job_ids'] or ['none'])}", None, {})),
+        ('detect_stats', '/api/heritage/detect/stats',
+         lambda ctx, rng, w, i: ('GET', '/api/heritage/detect/stats', None, {})),
+        ('issue_create', '/api/issues/create',
+         lambda ctx, rng, w, i: ('POST', '/api/issues/create', issue_report(ctx, rng), auth(ctx))),
+        ('issues_batch', '/api/issues/batch',
+         lambda ctx, rng, w, i: ('POST', '/api/issues/batch',
+                                 {'issues': [dict(issue_report(ctx, rng), clientId=f'suite-{w}-{i}-{n}') for n in range(5)]}, auth(ctx))),
+        ('issue_status', '/api/issues/<int:issue_id>/status',
+         lambda ctx, rng, w, i: ('PUT', f"/api/issues/{rng.randint(*ctx['issue_ids'])}/status",
+                                 {'status': rng.choice(['in_progress', 'resolved', 'pending'])}, {})),
+        ('stream', '/api/issues/stream',
+         lambda ctx, rng, w, i: ('GET', f"/api/issues/stream?since={max(ctx['last_seq'] - 20, 0)}", None, {})),
+        ('stream_stats', '/api/issues/stream/stats',
+         lambda ctx, rng, w, i: ('GET', '/api/issues/stream/stats', None, {})),
+        ('logout', '/api/auth/logout',
+         lambda ctx, rng, w, i: ('POST', '/api/auth/logout', None,
+                                 {'Authorization': f"Bearer {ctx['logout_token'](w, i)}"})),
+        ('metrics', '/metrics', lambda ctx, rng, w, i: ('GET', '/metrics', None, {})),
+    ]
+
+
+def send(conn, method, path, body, headers):
+    headers = dict(headers)
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    if response.getheader('Content-Type', '').startswith('text/event-stream'):
+        data = response.read1(65536)  # time to the first frames; the stream never ends
+        conn.close()
+    else:
+        data = response.read()
+    return response.status, data
+
+
+def run_route(name, build, ctx, args, index):
+    """Drive one route from args.concurrency clients; returns its summary"""
+    latencies, statuses, errors = [], {}, [0]
+    lock = threading.Lock()
+    gate = threading.Barrier(args.concurrency + 1)
+
+    def client(worker):
+        rng = random.Random(f'{args.seed}-{index}-{worker}')
+        conn = http.client.HTTPConnection(HOST, args.port, timeout=120)
+        local = []
+        gate.wait()
+        for i in range(args.requests):
+            method, path, body, headers = build(ctx, rng, worker, i)
+            started = time.perf_counter()
+            try:
+                status, data = send(conn, method, path, body, headers)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status, data = 'connection_error', b''
+            local.append(time.perf_counter() - started)
+            if name == 'detect_async' and status == 202:
+                with lock:
+                    ctx['job_ids'].append(json.loads(data)['jobId'])
+            with lock:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if not (isinstance(status, int) and 200 <= status < 400):
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(w,)) for w in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    gate.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    summary = summarize(latencies, time.perf_counter() - started, errors[0])
+    summary['status_codes'] = statuses
+    return summary
+
+
+# ---------------------------------------------------------------- memory
+
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def memory_mb(pid, field):
+    """Sum of a /proc status field (VmRSS, VmHWM) over the server's process tree"""
+    total = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith(field + ':'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return round(total / 1024, 1)
+
+
+# ---------------------------------------------------------------- commands
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='cityconne-suite-')
+    template = args.db or os.path.join(workdir, 'template.db')
+    photo_dir = template + '.photos'
+    fresh = not os.path.exists(template)
+    app_module = load_app(template, PHOTO_STORE_DIR=photo_dir, VISION_CLIENT='stub',
+                          PASSWORD_HASH_WORKERS=0, IMAGE_WORKERS=0)
+    seed_s = seed(app_module, args) if fresh else None
+
+    db_path = os.path.join(workdir, 'run.db')
+    copy_database(template, db_path)
+    conn = sqlite3.connect(db_path)
+    issue_ids = conn.execute('SELECT MIN(id), MAX(id), COUNT(*) FROM issue_reports').fetchone()
+    photo_issue_ids = [row[0] for row in conn.execute(
+        'SELECT id FROM issue_reports WHERE photo_sha256 IS NOT NULL ORDER BY id LIMIT 1000'
+    )]
+    dataset = {
+        'users': conn.execute('SELECT COUNT(*) FROM users').fetchone()[0],
+        'issues': issue_ids[2],
+        'issues_with_photos': conn.execute('SELECT COUNT(*) FROM issue_reports WHERE photo_sha256 IS NOT NULL').fetchone()[0],
+        'avg_photo_bytes': round(conn.execute('SELECT AVG(photo_size) FROM issue_reports').fetchone()[0] or 0),
+        'db_mb': round(os.path.getsize(db_path) / 1048576, 1),
+        'seed_s': round(seed_s, 1) if seed_s is not None else 'reused',
+    }
+    last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM issue_changes').fetchone()[0]
+    site_ids = [row[0] for row in conn.execute('SELECT id FROM heritage_sites')] or [1]
+    user = conn.execute('SELECT id, email, username FROM users ORDER BY id LIMIT 1').fetchone()
+    upload_digest = conn.execute(
+        'SELECT photo_sha256 FROM issue_reports WHERE photo_sha256 IS NOT NULL LIMIT 1'
+    ).fetchone()[0]
+    conn.close()
+    # Creates upload an already normalized, camera-sized photo
+    upload_photo = base64.b64encode(app_module.blob_store.read(upload_digest)).decode()
+
+    def logout_token(worker, i):
+        payload = {'user_id': user[0], 'email': user[1], 'username': user[2],
+                   'exp': datetime.now(timezone.utc) + timedelta(days=1), 'jti': f'{worker}-{i}'}
+        return jwt.encode(payload, app_module.JWT_SECRET, algorithm='HS256')
+
+    ctx = {
+        'users': dataset['users'],
+        'issue_ids': (issue_ids[0], issue_ids[1]),
+        'photo_issue_ids': photo_issue_ids or [issue_ids[0]],
+        'site_ids': site_ids,
+        'last_seq': last_seq,
+        'token': app_module.create_token(*user),
+        'logout_token': logout_token,
+        'upload_photo': upload_photo,
+        'job_ids': [],
+    }
+
+    server = start_server(
+        args.port, HOST,
+        DB_PATH=db_path,
+        PHOTO_STORE_DIR=photo_dir,
+        VISION_CLIENT='stub',
+        STUB_VISION_LATENCY=args.vision_latency,
+        WEB_CONCURRENCY=args.workers,
+        WEB_THREADS=args.threads,
+    )
+    routes = {}
+    try:
+        baseline_rss = memory_mb(server.pid, 'VmRSS')
+        selected = [s for s in scenarios() if not args.routes or s[0] in args.routes]
+        for index, (name, rule, build) in enumerate(selected):
+            summary = run_route(name, build, ctx, args, index)
+            summary['route'] = rule
+            summary['rss_mb_after'] = memory_mb(server.pid, 'VmRSS')
+            routes[name] = summary
+            print(f"{name:22} {summary['rps']:>8} rps  p50 {summary['p50_ms']:>9} ms  "
+                  f"p99 {summary['p99_ms']:>9} ms  {summary['status_codes']}", file=sys.stderr)
+        peak_rss = memory_mb(server.pid, 'VmHWM')
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=120)
+
+    covered = {rule for _, rule, _ in scenarios()}
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key != 'func'},
+        },
+        'dataset': dataset,
+        'routes': routes,
+        'uncovered_routes': sorted(
+            rule.rule for rule in app_module.app.url_map.iter_rules()
+            if rule.endpoint != 'static' and rule.rule not in covered
+        ),
+        'server': {'baseline_rss_mb': baseline_rss, 'peak_rss_mb': peak_rss},
+    }
+    body = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(body + '\n')
+    print(body)
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    for key in ('issues', 'users'):
+        if before['dataset'].get(key) != after['dataset'].get(key):
+            print(f"warning: runs used different datasets ({key}: "
+                  f"{before['dataset'].get(key)} vs {after['dataset'].get(key)})")
+    if before['meta']['args'].get('concurrency') != after['meta']['args'].get('concurrency'):
+        print('warning: runs used different concurrency')
+
+    regressions = []
+    print(f"{'route':22} {'metric':8} {'before':>10} {'after':>10} {'change':>8}")
+    for name in sorted(set(before['routes']) & set(after['routes'])):
+        old, new = before['routes'][name], after['routes'][name]
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+            if not old[metric]:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            if metric == 'rps':
+                regressed = change < -args.threshold
+            else:
+                regressed = change > args.threshold and new[metric] - old[metric] >= args.min_ms
+            flag = '  REGRESSION' if regressed else ''
+            print(f'{name:22} {metric:8} {old[metric]:>10} {new[metric]:>10} {change:>+8.1%}{flag}')
+            if regressed:
+                regressions.append((name, metric))
+        if new['errors'] > old['errors']:
+            print(f"{name:22} {'errors':8} {old['errors']:>10} {new['errors']:>10}  REGRESSION")
+            regressions.append((name, 'errors'))
+
+    old_rss, new_rss = before['server']['peak_rss_mb'], after['server']['peak_rss_mb']
+    rss_change = (new_rss - old_rss) / old_rss if old_rss else 0.0
+    rss_flag = '  REGRESSION' if rss_change > args.threshold else ''
+    print(f"{'server':22} {'peak_rss':8} {old_rss:>10} {new_rss:>10} {rss_change:>+8.1%}{rss_flag}")
+    if rss_flag:
+        regressions.append(('server', 'peak_rss_mb'))
+
+    print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}')
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed, serve and benchmark every route')
+    run_parser.add_argument('--issues', type=int, default=10000)
+    run_parser.add_argument('--users', type=int, default=1000)
+    run_parser.add_argument('--photos', type=int, default=8, help='distinct seeded photos')
+    run_parser.add_argument('--photo-fraction', type=float, default=0.8, help='share of issues with a photo')
+    run_parser.add_argument('--db', help='template database, seeded if missing and reused after (default: a temp file)')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--requests', type=int, default=50, help='requests per client per route')
+    run_parser.add_argument('--routes', nargs='+', help='only these scenarios (by name)')
+    run_parser.add_argument('--vision-latency', type=float, default=0.2, help='stub model latency (s)')
+    run_parser.add_argument('--workers', type=int, default=1, help='WEB_CONCURRENCY')
+    run_parser.add_argument('--threads', type=int, default=32, help='WEB_THREADS')
+    run_parser.add_argument('--port', type=int, default=6097)
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--out', help='also write the JSON results here')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser('compare', help='flag regressions between two runs')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='relative change that counts (0.10 = 10%%)')
+    compare_parser.add_argument('--min-ms', type=float, default=1.0, help='ignore latency changes smaller than this')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
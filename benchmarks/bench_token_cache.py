@@ -0,0 +1,50 @@
+"""
+Per-request authentication overhead with and without the verified-token cache.
+
+    python benchmarks/bench_token_cache.py --iterations 100000
+
+Times get_current_user() inside a request context for a valid bearer
+token, first with the cache bypassed (every call runs jwt.decode) and then
+with it warm.
+"""
+
+import argparse
+import json
+import time
+
+from common import load_app
+
+
+def time_calls(app_module, token, iterations):
+    headers = {'Authorization': f'Bearer {token}'}
+    with app_module.app.test_request_context('/api/issues/list', headers=headers):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            assert app_module.get_current_user() is not None
+        return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    app_module = load_app()
+    token = app_module.create_token(1, 'bench@example.com', 'bench')
+
+    app_module.token_cache = app_module.TokenCache(0)
+    uncached_us = time_calls(app_module, token, args.iterations)
+
+    app_module.token_cache = app_module.TokenCache(app_module.TOKEN_CACHE_SIZE)
+    cached_us = time_calls(app_module, token, args.iterations)
+
+    print(json.dumps({
+        'uncached_us_per_request': round(uncached_us, 2),
+        'cached_us_per_request': round(cached_us, 2),
+        'speedup': round(uncached_us / cached_us, 1),
+        'cache': app_module.token_cache.stats(),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Shared helpers for the backend benchmarks.
+
+Benchmarks import app.py against a scratch database so they never touch
+cityconne.db, and drive routes through Flask's test client from a pool of
+threads, or start the production server on one (start_server).
+"""
+
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(db_path=None, **env):
+    """Import app.py with DB_PATH (and any extra env) pointed at a scratch location"""
+    workdir = tempfile.mkdtemp(prefix='cityconne-bench-')
+    os.environ['DB_PATH'] = db_path or os.path.join(workdir, 'bench.db')
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')  # every client is 127.0.0.1
+    os.environ.update({key: str(value) for key, value in env.items()})
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    import app
+    return app
+
+
+def start_server(port, host='127.0.0.1', **env):
+    """
+    Start gunicorn with gunicorn.conf.py on host:port, with DB_PATH and any
+    other settings passed as env, and wait until /health answers
+    """
+    env = dict(os.environ, HOST=host, PORT=str(port), WEB_ACCESS_LOG='/dev/null',
+               **{key: str(value) for key, value in env.items()})
+    env.setdefault('RATE_LIMIT_ENABLED', '0')
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'app:app'], cwd=ROOT, env=env)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise SystemExit('server did not start')
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (milliseconds) for one run"""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def run_load(call, concurrency, requests_per_worker):
+    """
+    Run call(worker_index, iteration) from `concurrency` threads and time it.
+    call returns a truthy value on success.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start_gate = threading.Barrier(concurrency + 1)
+
+    def worker(index):
+        local, failed = [], 0
+        start_gate.wait()
+        for i in range(requests_per_worker):
+            t0 = time.perf_counter()
+            ok = call(index, i)
+            local.append(time.perf_counter() - t0)
+            if not ok:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start_gate.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, errors[0])
@@ -0,0 +1,57 @@
+"""
+Production server settings.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Threaded workers (gthread): each worker process serves WEB_THREADS requests
+at once and parks idle keep-alive connections without a thread. Every
+worker imports app.py itself, so its caches and background threads
+(catalogue watcher, change feed, vision event loop) live in that worker.
+The hashing and image process pools are per worker too; size
+PASSWORD_HASH_WORKERS and IMAGE_WORKERS to cores / WEB_CONCURRENCY, and set
+RATE_LIMIT_STORE=sqlite so the workers share one set of rate limit buckets.
+Workers write their metrics to METRICS_DIR (a temporary directory unless
+set), so a scrape of any worker reports the whole server.
+"""
+
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('BIND', f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '6000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '32'))
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+# Seconds a worker may go silent before it is restarted, and that a
+# stopping worker gets to finish in-flight requests
+timeout = int(os.getenv('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+preload_app = False
+accesslog = os.getenv('WEB_ACCESS_LOG', '-')
+
+
+_metrics_tmp = None
+
+
+def on_starting(server):
+    # Metrics start from zero with the server: clear files from a previous run
+    global _metrics_tmp
+    metrics_dir = os.getenv('METRICS_DIR')
+    if not metrics_dir:
+        metrics_dir = _metrics_tmp = tempfile.mkdtemp(prefix='cityconnect-metrics-')
+        os.environ['METRICS_DIR'] = metrics_dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(('.json', '.json.tmp')):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def on_exit(server):
+    if _metrics_tmp:
+        shutil.rmtree(_metrics_tmp, ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    import app
+    app.shutdown_background_work()
@@ -1,4 +1,3 @@
-import 'dart:convert';
 import 'dart:typed_data';
 
 import 'package:flutter/material.dart';
@@ -16,7 +15,14 @@ class IssuesFeedScreen extends StatefulWidget {
 }
 
 class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
-  late Future<List<Map<String, dynamic>>> _issuesFuture;
+  // Pages loaded so far; the next one is fetched when the list end is built
+  final List<Map<String, dynamic>> _issues = [];
+  String? _nextCursor;
+  bool _loading = true;
+  bool _loadingMore = false;
+  bool _loadMoreFailed = false;
+  Object? _error;
+  int _generation = 0; // bumped on reload so stale pages are dropped
   String _selectedFilter = 'all'; // all, pending, in_progress, resolved
 
   final List<Map<String, String>> statusFilters = [
@@ -47,12 +53,60 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
     _loadIssues();
   }
 
-  void _loadIssues() {
+  Future<void> _loadIssues() async {
+    final generation = ++_generation;
     setState(() {
-      _issuesFuture = ApiService.getIssuesList(
+      _issues.clear();
+      _nextCursor = null;
+      _loading = true;
+      _loadingMore = false;
+      _loadMoreFailed = false;
+      _error = null;
+    });
+    try {
+      final page = await ApiService.getIssuesPage(
         status: _selectedFilter == 'all' ? null : _selectedFilter,
       );
+      if (!mounted || generation != _generation) return;
+      setState(() {
+        _issues.addAll(page['issues']);
+        _nextCursor = page['nextCursor'];
+        _loading = false;
+      });
+    } catch (e) {
+      if (!mounted || generation != _generation) return;
+      setState(() {
+        _error = e;
+        _loading = false;
+      });
+    }
+  }
+
+  Future<void> _loadMore() async {
+    if (_loadingMore || _nextCursor == null) return;
+    final generation = _generation;
+    setState(() {
+      _loadingMore = true;
+      _loadMoreFailed = false;
     });
+    try {
+      final page = await ApiService.getIssuesPage(
+        status: _selectedFilter == 'all' ? null : _selectedFilter,
+        cursor: _nextCursor,
+      );
+      if (!mounted || generation != _generation) return;
+      setState(() {
+        _issues.addAll(page['issues']);
+        _nextCursor = page['nextCursor'];
+        _loadingMore = false;
+      });
+    } catch (e) {
+      if (!mounted || generation != _generation) return;
+      setState(() {
+        _loadingMore = false;
+        _loadMoreFailed = true;
+      });
+    }
   }
 
   String _formatDate(String dateString) {
@@ -100,6 +154,29 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
   return '${lat.toStringAsFixed(4)}, ${lng.toStringAsFixed(4)}';
 }
 
+  // Last list item while more pages exist: fetches the next page once it is
+  // built (i.e. scrolled near), or offers a retry after a failed fetch
+  Widget _buildLoadMore(double fontScale) {
+    if (_loadMoreFailed) {
+      return Center(
+        child: TextButton(
+          onPressed: _loadMore,
+          child: Text(
+            'Could not load more issues. Tap to retry',
+            style: TextStyle(fontSize: 14 * fontScale),
+          ),
+        ),
+      );
+    }
+    if (!_loadingMore) {
+      WidgetsBinding.instance.addPostFrameCallback((_) => _loadMore());
+    }
+    return const Padding(
+      padding: EdgeInsets.symmetric(vertical: 16),
+      child: Center(child: CircularProgressIndicator()),
+    );
+  }
+
   @override
   Widget build(BuildContext context) {
     final accessibility = Provider.of<AccessibilityService>(context);
@@ -209,10 +286,9 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
 
           // Issues List
           Expanded(
-            child: FutureBuilder<List<Map<String, dynamic>>>(
-              future: _issuesFuture,
-              builder: (context, snapshot) {
-                if (snapshot.connectionState == ConnectionState.waiting) {
+            child: Builder(
+              builder: (context) {
+                if (_loading) {
                   return Center(
                     child: Column(
                       mainAxisAlignment: MainAxisAlignment.center,
@@ -228,7 +304,7 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
                   );
                 }
 
-                if (snapshot.hasError) {
+                if (_error != null) {
                   return Center(
                     child: Column(
                       mainAxisAlignment: MainAxisAlignment.center,
@@ -247,7 +323,7 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
                   );
                 }
 
-                final issues = snapshot.data ?? [];
+                final issues = _issues;
 
                 if (issues.isEmpty) {
                   return Center(
@@ -283,8 +359,11 @@ class _IssuesFeedScreenState extends State<IssuesFeedScreen> {
 
                 return ListView.builder(
                   padding: const EdgeInsets.symmetric(horizontal: 24),
-                  itemCount: issues.length,
+                  itemCount: issues.length + (_nextCursor != null ? 1 : 0),
                   itemBuilder: (context, index) {
+                    if (index == issues.length) {
+                      return _buildLoadMore(fontScale);
+                    }
                     final issue = issues[index];
                     final status = issue['status'] ?? 'pending';
                     final category = issue['category'] ?? 'other';
@@ -451,73 +530,56 @@ class _IssueCard extends StatelessWidget {
               ],
             ),
 
-            // Photo Indicator
-            if (issue['photoBase64'] != null)
-              // Photo Indicator
+            // Photo Thumbnail
+            if (issue['photoSha256'] != null)
               Padding(
                 padding: const EdgeInsets.only(top: 12),
                 child: GestureDetector(
                   onTap: () {
-                    try {
-                      String base64String = issue['photoBase64'] ?? '';
-
-                      if (base64String.isEmpty) {
-                        ScaffoldMessenger.of(context).showSnackBar(
-                          const SnackBar(content: Text('No image available')),
-                        );
-                        return;
-                      }
-
-                      // 🔹 Remove data:image/... prefix if exists
-                      if (base64String.contains(',')) {
-                        base64String = base64String.split(',')[1];
-                      }
-
-                      // 🔹 Remove whitespace / line breaks
-                      base64String = base64String.replaceAll(RegExp(r'\s+'), '');
-
-                      // 🔹 Fix padding
-                      while (base64String.length % 4 != 0) {
-                        base64String += '=';
-                      }
-
-                      final bytes = base64Decode(base64String);
-
-                      showDialog(
-                        context: context,
-                        builder: (context) {
-                          return Dialog(
-                            backgroundColor: Colors.black,
-                            child: InteractiveViewer(
-                              child: Image.memory(
-                                bytes,
-                                fit: BoxFit.contain,
+                    showDialog(
+                      context: context,
+                      builder: (context) {
+                        return Dialog(
+                          backgroundColor: Colors.black,
+                          child: InteractiveViewer(
+                            child: Image.network(
+                              ApiService.issuePhotoUrl(issue['id'],
+                                  size: 'medium'),
+                              fit: BoxFit.contain,
+                              errorBuilder: (context, error, stackTrace) =>
+                                  const Padding(
+                                padding: EdgeInsets.all(24),
+                                child: Text('No image available',
+                                    style: TextStyle(color: Colors.white)),
                               ),
                             ),
-                          );
-                        },
-                      );
-                    } catch (e) {
-                      ScaffoldMessenger.of(context).showSnackBar(
-                        SnackBar(content: Text('Image decode failed: $e')),
-                      );
-                    }
+                          ),
+                        );
+                      },
+                    );
                   },
-                  child: Row(
-                    children: [
-                      const Icon(Icons.image, size: 16, color: Colors.blue),
-                      const SizedBox(width: 6),
-                      Text(
-                        'Photo attached',
-                        style: TextStyle(
-                          fontSize: 12 * fontScale,
-                          color: Colors.blue,
-                          fontWeight: FontWeight.w500,
-                          // decoration: TextDecoration
-                          //     .underline, // optional: looks clickable
-                        ),
+                  child: ClipRRect(
+                    borderRadius: BorderRadius.circular(8),
+                    child: Image.network(
+                      ApiService.issuePhotoUrl(issue['id'], size: 'thumb'),
+                      height: 120,
+                      width: double.infinity,
+                      fit: BoxFit.cover,
+                      errorBuilder: (context, error, stackTrace) => Row(
+                        children: [
+                          const Icon(Icons.image, size: 16, color: Colors.blue),
+                          const SizedBox(width: 6),
+                          Text(
+                            'Photo attached',
+                            style: TextStyle(
+                              fontSize: 12 * fontScale,
+                              color: Colors.blue,
+                              fontWeight: FontWeight.w500,
+                            ),
+                          ),
+                        ],
                       ),
-                    ],
+                    ),
                   ),
                 ),
               ),
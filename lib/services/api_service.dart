@@ -258,10 +258,13 @@ class ApiService {
     }
   }
 
-  /// Get list of issue reports
-  static Future<List<Map<String, dynamic>>> getIssuesList({
+  /// Get a page of issue reports, newest first. Returns 'issues', 'total'
+  /// (every matching issue) and 'nextCursor'; pass nextCursor back as
+  /// [cursor] for the following page (null on the last page).
+  static Future<Map<String, dynamic>> getIssuesPage({
     String? status,
     String? category,
+    String? cursor,
   }) async {
     try {
       final token = await _getAuthToken();
@@ -273,6 +276,7 @@ class ApiService {
       final params = <String>[];
       if (status != null) params.add('status=$status');
       if (category != null) params.add('category=$category');
+      if (cursor != null) params.add('cursor=${Uri.encodeQueryComponent(cursor)}');
       if (params.isNotEmpty) url += '?${params.join('&')}';
 
       final response = await http.get(
@@ -282,7 +286,11 @@ class ApiService {
 
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);
-        return List<Map<String, dynamic>>.from(data['issues'] ?? []);
+        return {
+          'issues': List<Map<String, dynamic>>.from(data['issues'] ?? []),
+          'total': data['total'] ?? 0,
+          'nextCursor': data['nextCursor'],
+        };
       } else {
         throw Exception('Failed to load issues');
       }
@@ -314,6 +322,12 @@ class ApiService {
     }
   }
 
+  /// URL of an issue photo; size is 'thumb' or 'medium' (omit for the original)
+  static String issuePhotoUrl(int issueId, {String? size}) {
+    final query = size != null ? '?size=$size' : '';
+    return '$baseUrl/api/issues/$issueId/photo$query';
+  }
+
   /// Update issue status
   static Future<Map<String, dynamic>> updateIssueStatus({
     required int issueId,